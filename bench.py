@@ -0,0 +1,422 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+import final
+
+def conversion_workload(progress_state, stop, counter):
+    # Stand-in for the worker thread: pure-Python JSON and hashing work that
+    # needs the GIL, updating progress_state the way get_playlist_items does.
+    entry = {
+        "mainUrl": "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+        "alternateUrl": "https://youtu.be/dQw4w9WgXcQ",
+        "title": "Never Gonna Give You Up - Rick Astley",
+        "description": "",
+        "tags": "pop, 80s, dance",
+        "image": "Assets/Squirt/playlists/Bench/album_art/cover.png"
+    }
+    start = time.time()
+    while not stop.is_set():
+        for _ in range(100):
+            hashlib.md5(json.dumps(json.loads(json.dumps(entry))).encode()).hexdigest()
+        counter[0] += 1
+        elapsed = time.time() - start
+        progress_state["current_title"] = f"Track {counter[0]} - {entry['title']}"
+        progress_state["current_idx"] = counter[0]
+        progress_state["total"] = counter[0] * 2
+        progress_state["progress"] = (elapsed % 10) / 10
+        progress_state["vps"] = counter[0] / elapsed if elapsed > 0 else 0
+        progress_state["eta"] = final.format_duration(elapsed)
+
+def run_workload(duration, progress_state, root=None):
+    stop = threading.Event()
+    counter = [0]
+    worker = threading.Thread(target=conversion_workload, args=(progress_state, stop, counter), daemon=True)
+    worker.start()
+    if root is None:
+        time.sleep(duration)
+    else:
+        root.after(int(duration * 1000), root.quit)
+        root.mainloop()
+    stop.set()
+    worker.join()
+    return counter[0] / duration
+
+def bench_gui(args):
+    import tkinter as tk
+
+    cli_rate = run_workload(args.duration, {"progress": 0.0})
+    print(f"GUI off: {cli_rate:.1f} work units/sec")
+    try:
+        root = final.create_gui("bench", "bench", "bench")
+    except tk.TclError as e:
+        print(f"GUI on: skipped, Tk could not start ({e})")
+        return
+    # Show the progress canvases as start_conversion would, without converting.
+    pending = [root]
+    while pending:
+        widget = pending.pop()
+        if isinstance(widget, tk.Canvas):
+            widget.pack()
+        pending.extend(widget.winfo_children())
+    gui_rate = run_workload(args.duration, root.progress_state, root=root)
+    root.destroy()
+    print(f"GUI on:  {gui_rate:.1f} work units/sec ({gui_rate / cli_rate * 100:.0f}% of GUI off)")
+
+def time_python(code, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def bench_startup(args):
+    # Eager imports approximate the old module header, for comparison.
+    lazy = time_python("import final", args.runs)
+    eager = time_python("import final, googleapiclient.discovery, colorsys\ntry:\n    import tkinter\nexcept ImportError:\n    pass", args.runs)
+    print(f"import final (lazy):         {lazy * 1000:.0f} ms median of {args.runs}")
+    print(f"import final + eager deps:   {eager * 1000:.0f} ms median of {args.runs}")
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, final; print(' '.join(m for m in ('tkinter', 'googleapiclient.discovery', 'colorsys') if m in sys.modules) or 'none')"],
+        check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout.strip()
+    print(f"heavy modules loaded by import: {loaded}")
+    start = time.perf_counter()
+    first = final.get_youtube_client("bench")
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    again = final.get_youtube_client("bench")
+    reused = time.perf_counter() - start
+    print(f"YouTube client: first build {built * 1000:.1f} ms, reuse {reused * 1000:.3f} ms (same object: {first is again})")
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    # Just enough of the YouTube Data API, Last.fm ws/2.0 and an album art host
+    # for final.py. Playlist "BENCH<n>" has n items; video IDs include n so
+    # different sizes never share cache entries.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this every
+    # keep-alive response stalls on delayed ACKs.
+    disable_nagle_algorithm = True
+    latency = 0.0
+    error_rate = 0.0
+    artists = 200
+    art_bytes = 8 * 1024
+    counts = Counter()
+    counts_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, status=200, content_type="application/json", headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def count(self, name):
+        with self.counts_lock:
+            self.counts[name] += 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        route = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if route == "_stats":
+            with self.counts_lock:
+                return self.send_body(dict(self.counts))
+        if route == "_reset":
+            with self.counts_lock:
+                self.counts.clear()
+            return self.send_body({})
+
+        upstream = "art" if url.path.startswith("/art/") else "lastfm" if route == "2.0" else "youtube"
+        self.count(f"{upstream}:{query.get('method', route)}")
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self.count("errors")
+            return self.send_body(b"", status=503, headers={"Retry-After": "0"})
+
+        if route == "playlists":
+            items = []
+            for playlist_id in query["id"].split(","):
+                match = re.fullmatch(r"BENCH(\d+)", playlist_id)
+                if match:
+                    items.append({
+                        "id": playlist_id,
+                        "snippet": {"title": f"Bench {match.group(1)}"},
+                        "contentDetails": {"itemCount": int(match.group(1))}
+                    })
+            return self.send_body({"items": items})
+        if route == "playlistItems":
+            match = re.fullmatch(r"BENCH(\d+)", query["playlistId"])
+            size = int(match.group(1)) if match else 0
+            start = int(query.get("pageToken") or 0)
+            end = min(size, start + int(query.get("maxResults", 50)))
+            page = {
+                "etag": f"{query['playlistId']}-{start}",
+                "items": [
+                    {"etag": f"item-{size}x{i}", "snippet": {"resourceId": {"videoId": f"b{size}x{i}"}}}
+                    for i in range(start, end)
+                ],
+                "pageInfo": {"totalResults": size}
+            }
+            if end < size:
+                page["nextPageToken"] = str(end)
+            if self.headers.get("If-None-Match") == page["etag"]:
+                return self.send_body(b"", status=304)
+            return self.send_body(page)
+        if route == "videos":
+            items = []
+            for video_id in query["id"].split(","):
+                index = int(video_id.rsplit("x", 1)[-1])
+                items.append({
+                    "id": video_id,
+                    "snippet": {"title": f"Track {index}", "channelTitle": f"Artist {index % self.artists} - Topic"},
+                    "contentDetails": {"duration": "PT3M30S"},
+                    "statistics": {"viewCount": str(index)}
+                })
+            return self.send_body({"items": items})
+        if upstream == "lastfm":
+            artist, track = query.get("artist", ""), query.get("track", "")
+            if query.get("method") == "track.search":
+                return self.send_body({"results": {"trackmatches": {"track": [{"name": track, "artist": artist}]}}})
+            art_name = re.sub(r"\W+", "_", artist)
+            art_url = f"http://{self.headers['Host']}/art/{art_name}.png"
+            return self.send_body({"track": {
+                "name": track,
+                "artist": {"name": artist},
+                "album": {"image": [{"#text": art_url, "size": "extralarge"}]},
+                "toptags": {"tag": [{"name": "bench"}, {"name": artist.lower()}]}
+            }})
+        if upstream == "art":
+            return self.send_body(b"\x89PNG" + b"\0" * self.art_bytes, content_type="image/png")
+        self.send_body({"error": "not found"}, status=404)
+
+def bench_serve(args):
+    FakeUpstreamHandler.latency = args.latency
+    FakeUpstreamHandler.error_rate = args.error_rate
+    FakeUpstreamHandler.artists = args.artists
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeUpstreamHandler)
+    server.daemon_threads = True
+    base = f"http://127.0.0.1:{server.server_port}"
+    print(f"Fake upstream listening on {base}", flush=True)
+    print(f"Point final.py at it with PROTV_YOUTUBE_API_ENDPOINT={base} PROTV_LASTFM_API_URL={base}/2.0/ and --playlist BENCH<items>", flush=True)
+    server.serve_forever()
+
+def start_fake_upstream(args):
+    # A separate process, so the fake servers do not compete with the code
+    # under test for the GIL.
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve", "--port", "0", "--latency", str(args.latency),
+         "--error-rate", str(args.error_rate), "--artists", str(args.artists)],
+        stdout=subprocess.PIPE, text=True
+    )
+    base = process.stdout.readline().split()[-1]
+    return process, base
+
+def upstream_counts(base, reset=False):
+    counts = requests.get(f"{base}/_stats", timeout=5).json()
+    if reset:
+        requests.get(f"{base}/_reset", timeout=5)
+    return counts
+
+def format_counts(counts):
+    totals = Counter()
+    for name, value in counts.items():
+        totals[name.split(":", 1)[0]] += value
+    return ", ".join(f"{name} {totals[name]}" for name in ("youtube", "lastfm", "art", "errors"))
+
+def bench_sizes(args):
+    return [int(size) for size in args.sizes.split(",")]
+
+def bench_items(args):
+    process, base = start_fake_upstream(args)
+    workdir = tempfile.mkdtemp(prefix="protv-bench-")
+    try:
+        final.YOUTUBE_API_ENDPOINT = base
+        final.LASTFM_API_URL = base + "/2.0/"
+        final.CACHE_DIR = os.path.join(workdir, "cache")
+        os.makedirs(final.CACHE_DIR)
+        final.configure_cache(args.cache_backend)
+        final.configure_quota(10 ** 9)
+        print(f"get_playlist_items, fake upstream latency {args.latency * 1000:.0f} ms, error rate {args.error_rate:.0%}; peak is tracemalloc")
+        print(f"{'items':>7}  {'pass':<5}  {'seconds':>8}  {'items/s':>8}  {'peak MB':>8}  requests")
+        for size in bench_sizes(args):
+            for label in ("cold", "warm") if args.warm else ("cold",):
+                output_dir = os.path.join(workdir, f"out{size}")
+                shutil.rmtree(output_dir, ignore_errors=True)
+                upstream_counts(base, reset=True)
+                tracemalloc.start()
+                start = time.perf_counter()
+                items = final.get_playlist_items(
+                    f"BENCH{size}", "bench", "bench", "bench", output_dir, f"Bench {size}", {"progress": 0.0},
+                    lastfm_rate=args.lastfm_rate
+                )
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{len(items):>7}  {label:<5}  {elapsed:>8.2f}  {len(items) / elapsed:>8.1f}  {peak / 2 ** 20:>8.1f}  {format_counts(upstream_counts(base))}")
+                del items
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# Runs final.py's main() and reports the child's peak RSS on stderr.
+CLI_WRAPPER = """import runpy, sys
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    try:
+        import resource
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024), file=sys.stderr)
+    except ImportError:
+        print("", file=sys.stderr)
+"""
+
+def bench_cli(args):
+    process, base = start_fake_upstream(args)
+    workdir = tempfile.mkdtemp(prefix="protv-bench-")
+    try:
+        with open(os.path.join(workdir, final.CONFIG_FILE), "w") as f:
+            json.dump({"YOUTUBE_API_KEY": "bench", "LASTFM_API_KEY": "bench", "LASTFM_API_SECRET": "bench"}, f)
+        env = dict(os.environ, PROTV_YOUTUBE_API_ENDPOINT=base, PROTV_LASTFM_API_URL=base + "/2.0/")
+        metrics_path = os.path.join(workdir, "metrics.json")
+        print(f"final.py main(), fake upstream latency {args.latency * 1000:.0f} ms, error rate {args.error_rate:.0%}; peak is child RSS")
+        print(f"{'items':>7}  {'pass':<5}  {'seconds':>8}  {'items/s':>8}  {'peak MB':>8}  requests")
+        for size in bench_sizes(args):
+            for label in ("cold", "warm") if args.warm else ("cold",):
+                output_dir = os.path.join(workdir, f"out{size}")
+                shutil.rmtree(output_dir, ignore_errors=True)
+                upstream_counts(base, reset=True)
+                start = time.perf_counter()
+                result = subprocess.run(
+                    [sys.executable, "-c", CLI_WRAPPER, os.path.abspath(final.__file__),
+                     "--playlist", f"BENCH{size}", "--output", output_dir, "--lastfm-rate", str(args.lastfm_rate),
+                     "--quota-budget", str(10 ** 9), "--cache-backend", args.cache_backend, "--metrics", metrics_path],
+                    cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+                )
+                elapsed = time.perf_counter() - start
+                if result.returncode:
+                    print(f"{size:>7}  {label:<5}  failed with exit code {result.returncode}:\n{result.stderr}")
+                    return
+                rss = result.stderr.strip().splitlines()[-1]
+                peak = f"{int(rss) / 2 ** 20:>8.1f}" if rss else f"{'n/a':>8}"
+                print(f"{size:>7}  {label:<5}  {elapsed:>8.2f}  {size / elapsed:>8.1f}  {peak}  {format_counts(upstream_counts(base))}")
+                with open(metrics_path) as f:
+                    stages = json.load(f)["stages"]
+                print("         stages: " + ", ".join(f"{name} {stage['seconds']:.2f}s" for name, stage in stages.items()))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def synthetic_entries(count):
+    for i in range(count):
+        video_id = hashlib.md5(str(i).encode()).hexdigest()[:11]
+        yield {
+            "mainUrl": f"https://www.youtube.com/watch?v={video_id}",
+            "alternateUrl": f"https://youtu.be/{video_id}",
+            "title": f"Track {i} (Live at Budokan) - Artist {i % 200}",
+            "description": "",
+            "tags": "rock, live, japanese, 80s",
+            "image": f"Assets/Squirt/playlists/Bench/album_art/cover{i % 200}.png"
+        }
+
+def load_playlist(path, output_format, loads=json.loads):
+    if output_format == "ndjson":
+        with open(path, "rb") as f:
+            lines = f.read().splitlines()
+        return {"header": loads(lines[0])["header"], "entries": [loads(line) for line in lines[1:]]}
+    opener = gzip.open if output_format == "gzip" else open
+    with opener(path, "rb") as f:
+        return loads(f.read())
+
+def bench_formats(args):
+    workdir = tempfile.mkdtemp(prefix="protv-bench-")
+    loaders = [("json", json.loads)]
+    if final.orjson is not None:
+        loaders.append(("orjson", final.orjson.loads))
+    print(f"Writer encodes compact formats with {'orjson' if final.orjson is not None else 'json'}; load times are the median of {args.runs}")
+    print(f"{'items':>7}  {'format':<9}  {'MB':>8}  {'vs protv':>8}  {'write s':>8}  " + "  ".join(f"{'load ' + name:>11}" for name, _ in loaders))
+    try:
+        for size in bench_sizes(args):
+            baseline = None
+            reference = None
+            for output_format in ["protv"] + sorted(set(final.OUTPUT_FORMATS) - {"protv"}):
+                path = os.path.join(workdir, "bench" + final.OUTPUT_FORMATS[output_format])
+                start = time.perf_counter()
+                with final.PlaylistWriter(path, "Bench", output_format=output_format) as writer:
+                    for entry in synthetic_entries(size):
+                        writer.write(entry)
+                written = time.perf_counter() - start
+                file_size = os.path.getsize(path)
+                baseline = baseline or file_size
+                load_times = []
+                for name, loads in loaders:
+                    times = []
+                    for _ in range(args.runs):
+                        start = time.perf_counter()
+                        playlist = load_playlist(path, output_format, loads)
+                        times.append(time.perf_counter() - start)
+                    load_times.append(statistics.median(times))
+                # Every format has to round-trip to the same playlist.
+                reference = reference or playlist
+                if playlist != reference:
+                    print(f"{size:>7}  {output_format:<9}  loaded playlist differs from protv")
+                print(f"{size:>7}  {output_format:<9}  {file_size / 2 ** 20:>8.2f}  {file_size / baseline:>8.0%}  {written:>8.3f}  " + "  ".join(f"{seconds:>11.4f}" for seconds in load_times))
+                os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+SCENARIOS = {
+    "cli": bench_cli,
+    "formats": bench_formats,
+    "gui": bench_gui,
+    "items": bench_items,
+    "serve": bench_serve,
+    "startup": bench_startup,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the playlist converter.")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS), help="Benchmark to run")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run timed workloads")
+    parser.add_argument("--runs", type=int, default=5, help="Repetitions for startup and load timings")
+    parser.add_argument("--sizes", default="100,5000,50000", help="Comma-separated playlist sizes for the items, cli and formats scenarios")
+    parser.add_argument("--warm", action="store_true", help="Repeat each size against the cache filled by the first pass")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake upstream waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake upstream responses that are 503s")
+    parser.add_argument("--artists", type=int, default=200, help="Distinct artists (and album art files) in fake playlists")
+    parser.add_argument("--lastfm-rate", type=float, default=1000, help="Last.fm requests per second allowed during the run")
+    parser.add_argument("--cache-backend", choices=["sqlite", "files"], default=final.CACHE_BACKEND, help="Cache storage used during the run")
+    parser.add_argument("--port", type=int, default=8089, help="Port for the serve scenario (0 picks a free one)")
+    args = parser.parse_args()
+    SCENARIOS[args.scenario](args)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
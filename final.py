@@ -3,20 +3,109 @@ import json
 import os
 import hashlib
 import requests
-from googleapiclient.discovery import build
 import re
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 import sys
 import threading
-import colorsys
+import shutil
+import tempfile
+import sqlite3
+import zlib
+import random
+import email.utils
+import textwrap
+import difflib
+import math
+import datetime
+import zoneinfo
+import bisect
+import uuid
+import queue
+import atexit
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 CONFIG_FILE = "config.json"
 CACHE_DIR = "cache"
+CACHE_BACKEND = "sqlite"
+CACHE_DB_NAME = "cache.sqlite3"
+CACHE_TTLS = {"youtube": 7 * 24 * 3600, "lastfm": 30 * 24 * 3600, "lastfm_miss": 3 * 24 * 3600}
+CACHE_NAMESPACES = ("youtube", "lastfm", "lastfm_miss", "lastfm_index", "tracks")
+# Namespaces the file backend stores as bare cache/<md5>.json, as it always has.
+FILE_CACHE_LEGACY_NAMESPACES = ("youtube", "lastfm")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_EVICT_TO = 0.9
+VIDEO_DETAILS_PART = "snippet,contentDetails,statistics"
+VIDEO_BATCH_SIZE = 50
+# Both endpoints can be pointed at local fakes (see bench.py). The YouTube
+# cache keys do not include the endpoint, so use a separate working directory.
+YOUTUBE_API_ENDPOINT = os.environ.get("PROTV_YOUTUBE_API_ENDPOINT")
+LASTFM_API_URL = os.environ.get("PROTV_LASTFM_API_URL", "http://ws.audioscrobbler.com/2.0/")
+LASTFM_WORKERS = 8
+LASTFM_RATE_LIMIT = 5
+TITLE_NOISE_RE = re.compile(
+    r"\s*[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|remaster(ed)?|hd|hq|4k|8k|mv|m/v)\b[^\)\]]*[\)\]]",
+    re.IGNORECASE
+)
+# Release variants appended after a dash: "Song - Remastered 2011", "Song - Live at Wembley".
+TITLE_SUFFIX_NOISE_RE = re.compile(
+    r"\s+[-\u2013\u2014]\s+(\d{4}\s+)?(remaster(ed)?|live(\s+(at|in|from|on)\b.*)?|radio\s+edit|single\s+version|mono|stereo)(\s+(\d{4}|version))*$",
+    re.IGNORECASE
+)
+CHANNEL_NOISE_RE = re.compile(r"(\s*-\s*topic|vevo|\s+official)$", re.IGNORECASE)
+TRACK_MATCH_CUTOFF = 0.8
+ALBUM_ART_WORKERS = 4
+ALBUM_ART_CHUNK_SIZE = 64 * 1024
+ALBUM_ART_STORE_NAME = "album_art"
+BATCH_PARALLEL_PLAYLISTS = 2
+ITEM_WINDOW = 500
+PIPELINE_PAGE_QUEUE = 4
+PIPELINE_POLL = 0.1
+PIPELINE_STAGES = ("pagination", "details", "lastfm", "album_art", "write")
+PIPELINE_DONE = object()
+PARTIAL_MISMATCH_MESSAGE = "The partially written playlist no longer matches the YouTube playlist; run again without --resume"
+# protv is the indented format ProTV has always been given; the others are
+# smaller or streamable for loaders that accept them.
+OUTPUT_FORMATS = {"protv": ".playlist", "minified": ".playlist", "gzip": ".playlist.gz", "ndjson": ".ndjson"}
+OUTPUT_GZIP_LEVEL = 6
+QUOTA_FILE_NAME = "quota.json"
+YOUTUBE_QUOTA_BUDGET = 10000
+YOUTUBE_QUOTA_COSTS = {"playlists.list": 1, "playlistItems.list": 1, "videos.list": 1, "channels.list": 1}
+GUI_FONT = ("Segoe UI", 12, "bold")
+GUI_CHAR_WIDTH = 13
+GUI_TEXT_Y = 14
+GUI_FRAME_MS = 50
+# The text hue moves in this many steps per cycle, so most frames leave the
+# character colours alone.
+GUI_HUE_STEPS = 12
+CHECKPOINT_INTERVAL = 5
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 4
+HTTP_BACKOFF = 0.5
+HTTP_BACKOFF_MAX = 30
+HTTP_POOL_SIZE = 32
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LASTFM_TRANSIENT_ERRORS = {8, 11, 16, 29}
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_MAX_JOBS = 1000
+SERVICE_JOB_OPTIONS = ("no_music", "incremental", "resume")
+METRICS_PREFIX = "protv_"
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# tkinter and googleapiclient are imported inside the functions that need
+# them, so headless CLI runs start fast and work without Tk installed.
+
 def setup_api_keys_gui():
     import webbrowser
+    import tkinter as tk
+    from tkinter import messagebox, ttk
 
     def open_url(url):
         webbrowser.open(url)
@@ -24,14 +113,14 @@ def setup_api_keys_gui():
     def validate_keys(yt_key, lastfm_key, lastfm_secret):
         # Test YouTube key
         try:
-            yt_service = build("youtube", "v3", developerKey=yt_key)
-            yt_service.channels().list(part="snippet", id="UC_x5XG1OV2P6uZZ5FSM9Ttw").execute()
+            yt_service = get_youtube_client(yt_key)
+            execute_with_retry(yt_service.channels().list(part="snippet", id="UC_x5XG1OV2P6uZZ5FSM9Ttw"))
         except Exception as e:
             return False, f"Invalid YouTube API key or network error:\n{e}"
         # Test Last.fm key/secret
         try:
-            resp = requests.get(
-                "http://ws.audioscrobbler.com/2.0/",
+            resp = http_get(
+                LASTFM_API_URL,
                 params={
                     "method": "track.getInfo",
                     "api_key": lastfm_key,
@@ -135,133 +224,1740 @@ def is_safe_path(path):
     abs_path = os.path.abspath(path)
     return abs_path == os.path.normpath(abs_path) and '..' not in path
 
-def cache_get_or_fetch(url, params):
-    cache_key = hashlib.md5((url + json.dumps(params, sort_keys=True)).encode()).hexdigest()
-    cache_path = os.path.join(CACHE_DIR, cache_key + ".json")
-    if os.path.exists(cache_path):
-        with open(cache_path, "r") as f:
-            return json.load(f)
+class Metrics:
+    # Process-wide stage timings, counters and per-upstream latency histograms.
+    # Stage seconds are summed across threads, so parallel stages can add up to
+    # more than the wall-clock run time.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.latencies = {}
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, upstream, seconds):
+        with self.lock:
+            histogram = self.latencies.get(upstream)
+            if histogram is None:
+                histogram = self.latencies[upstream] = {"buckets": [0] * (len(METRICS_LATENCY_BUCKETS) + 1), "count": 0, "sum": 0.0}
+            histogram["buckets"][bisect.bisect_left(METRICS_LATENCY_BUCKETS, seconds)] += 1
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stage = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "errors": 0})
+                stage["calls"] += 1
+                stage["seconds"] += elapsed
+                stage["errors"] += failed
+
+    def snapshot(self):
+        with self.lock:
+            latency = {}
+            for upstream, histogram in self.latencies.items():
+                cumulative = 0
+                buckets = {}
+                for bound, hits in zip(METRICS_LATENCY_BUCKETS + ("+Inf",), histogram["buckets"]):
+                    cumulative += hits
+                    buckets[str(bound)] = cumulative
+                latency[upstream] = {"count": histogram["count"], "sum": round(histogram["sum"], 6), "buckets": buckets}
+            return {
+                "elapsed": round(time.time() - self.started, 6),
+                "stages": {name: dict(stage, seconds=round(stage["seconds"], 6)) for name, stage in sorted(self.stages.items())},
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "latency": latency
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self):
+        def series(name, labels=()):
+            rendered = ",".join(f'{label}="{value}"' for label, value in labels)
+            return f"{METRICS_PREFIX}{name}{{{rendered}}}" if rendered else METRICS_PREFIX + name
+
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {METRICS_PREFIX}run_seconds gauge", f"{series('run_seconds')} {snapshot['elapsed']}"]
+        for metric, field in (("stage_calls_total", "calls"), ("stage_seconds_total", "seconds"), ("stage_errors_total", "errors")):
+            lines.append(f"# TYPE {METRICS_PREFIX}{metric} counter")
+            for name, stage in snapshot["stages"].items():
+                lines.append(f"{series(metric, [('stage', name)])} {stage[field]}")
+        typed = set()
+        for counter in snapshot["counters"]:
+            if counter["name"] not in typed:
+                typed.add(counter["name"])
+                lines.append(f"# TYPE {METRICS_PREFIX}{counter['name']} counter")
+            lines.append(f"{series(counter['name'], counter['labels'].items())} {counter['value']}")
+        lines.append(f"# TYPE {METRICS_PREFIX}upstream_latency_seconds histogram")
+        for upstream, histogram in sorted(snapshot["latency"].items()):
+            for bound, hits in histogram["buckets"].items():
+                lines.append(f"{series('upstream_latency_seconds_bucket', [('upstream', upstream), ('le', bound)])} {hits}")
+            lines.append(f"{series('upstream_latency_seconds_sum', [('upstream', upstream)])} {histogram['sum']}")
+            lines.append(f"{series('upstream_latency_seconds_count', [('upstream', upstream)])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def write_metrics(path, fmt="json"):
+    text = metrics.to_prometheus() if fmt == "prometheus" else metrics.to_json() + "\n"
+    if path == "-":
+        sys.stdout.write(text)
     else:
-        response = requests.get(url, params=params)
-        data = response.json()
-        with open(cache_path, "w") as f:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"Metrics written to {path}")
+
+def start_profiling():
+    # cProfile only sees the thread that enabled it, so every thread started
+    # from now on gets its own profiler and they are merged on stop.
+    import cProfile
+
+    profilers = [cProfile.Profile()]
+    profilers_lock = threading.Lock()
+
+    def profile_thread(*args):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ profiles all threads from the first profiler.
+            return
+        with profilers_lock:
+            profilers.append(profiler)
+
+    threading.setprofile(profile_thread)
+    profilers[0].enable()
+    return profilers
+
+def stop_profiling(profilers, path):
+    import pstats
+
+    threading.setprofile(None)
+    profilers[0].disable()
+    stats = pstats.Stats(*profilers)
+    stats.dump_stats(path)
+    print(f"Profile written to {path} (inspect with: python -m pstats {path})")
+
+# One keep-alive session shared by every Last.fm and album art request in the process.
+http_session = requests.Session()
+http_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+http_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE))
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt, retry_after=None):
+    # Honour Retry-After when the server sends one, otherwise use
+    # exponential backoff with full jitter.
+    delay = parse_retry_after(retry_after)
+    if delay is None:
+        delay = random.uniform(0, HTTP_BACKOFF * 2 ** attempt)
+    return min(delay, HTTP_BACKOFF_MAX)
+
+def http_get(url, upstream="http", **kwargs):
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    for attempt in range(HTTP_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            response = http_session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.count("upstream_errors_total", upstream=upstream, kind=type(e).__name__)
+            if attempt == HTTP_RETRIES:
+                raise
+            metrics.count("upstream_retries_total", upstream=upstream)
+            time.sleep(retry_delay(attempt))
+            continue
+        metrics.observe(upstream, time.perf_counter() - start)
+        if response.status_code >= 400:
+            metrics.count("upstream_errors_total", upstream=upstream, kind=response.status_code)
+        if response.status_code not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+            return response
+        metrics.count("upstream_retries_total", upstream=upstream)
+        delay = retry_delay(attempt, response.headers.get("Retry-After"))
+        response.close()
+        time.sleep(delay)
+
+class QuotaExhausted(Exception):
+    pass
+
+def quota_day_start(now=None):
+    # YouTube Data API quotas reset at midnight Pacific time.
+    try:
+        tz = zoneinfo.ZoneInfo("America/Los_Angeles")
+    except zoneinfo.ZoneInfoNotFoundError:
+        tz = datetime.timezone(datetime.timedelta(hours=-8))
+    now = datetime.datetime.fromtimestamp(now or time.time(), tz)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+class QuotaTracker:
+    # Counts YouTube units spent per call type for the current quota day and
+    # refuses (or waits for the reset) once the daily budget is used up.
+    def __init__(self, path, budget=YOUTUBE_QUOTA_BUDGET, wait=False):
+        self.path = path
+        self.budget = budget
+        self.wait = wait
+        self.lock = threading.Lock()
+        self.day = quota_day_start().date().isoformat()
+        self.spent = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    state = json.load(f)
+                if state.get("day") == self.day:
+                    self.spent = state.get("spent", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable quota file {path}: {e}")
+
+    def used(self):
+        return sum(self.spent.values())
+
+    def remaining(self):
+        return max(0, self.budget - self.used())
+
+    def seconds_until_reset(self):
+        next_reset = quota_day_start() + datetime.timedelta(days=1)
+        return max(0.0, next_reset.timestamp() - time.time())
+
+    def _roll_day(self):
+        day = quota_day_start().date().isoformat()
+        if day != self.day:
+            self.day = day
+            self.spent = {}
+
+    def spend(self, call_type):
+        cost = YOUTUBE_QUOTA_COSTS.get(call_type, 1)
+        while True:
+            with self.lock:
+                self._roll_day()
+                if self.used() + cost <= self.budget:
+                    self.spent[call_type] = self.spent.get(call_type, 0) + cost
+                    self._save()
+                    return
+                wait = self.seconds_until_reset()
+            if not self.wait:
+                raise QuotaExhausted(
+                    f"YouTube quota budget of {self.budget} units is used up for today; "
+                    f"resets in {format_duration(wait)}. Re-run with --resume after the reset."
+                )
+            print(f"YouTube quota budget used up; waiting {format_duration(wait)} for the daily reset")
+            time.sleep(wait + 5)
+
+    def exhaust(self):
+        # The API said we are out, whatever our own count says.
+        with self.lock:
+            self._roll_day()
+            shortfall = self.budget - self.used()
+            if shortfall > 0:
+                self.spent["quotaExceeded"] = self.spent.get("quotaExceeded", 0) + shortfall
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"day": self.day, "spent": self.spent}, f)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        spent = ", ".join(f"{call}: {units}" for call, units in sorted(self.spent.items())) or "nothing yet"
+        return f"{self.used()} of {self.budget} YouTube quota units used today ({spent}); resets in {format_duration(self.seconds_until_reset())}"
+
+_quota_tracker = None
+
+def get_quota_tracker():
+    global _quota_tracker
+    with _cache_lock:
+        if _quota_tracker is None:
+            _quota_tracker = QuotaTracker(os.path.join(CACHE_DIR, QUOTA_FILE_NAME))
+        return _quota_tracker
+
+def configure_quota(budget, wait=False):
+    tracker = get_quota_tracker()
+    tracker.budget = budget
+    tracker.wait = wait
+
+def is_quota_error(error):
+    return error.resp.status == 403 and any(
+        reason.encode() in (error.content or b"") for reason in ("quotaExceeded", "dailyLimitExceeded")
+    )
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 3600:
+        return f"{seconds//60}:{seconds%60:02d}"
+    return f"{seconds//3600}:{(seconds%3600)//60:02d}:{seconds%60:02d}"
+
+def execute_with_retry(request):
+    # Same policy as http_get, applied to googleapiclient requests. Every
+    # attempt is charged to the quota tracker before it is sent.
+    from googleapiclient.errors import HttpError
+    import httplib2
+
+    quota = get_quota_tracker()
+    call_type = request.methodId.split(".", 1)[-1]
+    for attempt in range(HTTP_RETRIES + 1):
+        quota.spend(call_type)
+        start = time.perf_counter()
+        try:
+            response = request.execute()
+            metrics.observe("youtube", time.perf_counter() - start)
+            return response
+        except HttpError as e:
+            metrics.observe("youtube", time.perf_counter() - start)
+            if e.resp.status >= 400:
+                metrics.count("upstream_errors_total", upstream="youtube", kind=e.resp.status)
+            if is_quota_error(e):
+                quota.exhaust()
+                if not quota.wait or attempt == HTTP_RETRIES:
+                    raise QuotaExhausted(f"YouTube reported the daily quota as exceeded: {e}") from e
+                continue
+            if e.resp.status not in RETRY_STATUSES or attempt == HTTP_RETRIES:
+                raise
+            delay = retry_delay(attempt, e.resp.get("retry-after"))
+        except (OSError, httplib2.HttpLib2Error) as e:
+            metrics.count("upstream_errors_total", upstream="youtube", kind=type(e).__name__)
+            if attempt == HTTP_RETRIES:
+                raise
+            delay = retry_delay(attempt)
+        metrics.count("upstream_retries_total", upstream="youtube")
+        time.sleep(delay)
+
+_youtube_clients = {}
+_youtube_clients_lock = threading.Lock()
+_youtube_http = threading.local()
+
+def build_youtube_request(http, *args, **kwargs):
+    # httplib2 connections are not thread-safe, so the shared client hands each
+    # thread its own keep-alive Http object.
+    from googleapiclient.http import HttpRequest
+    import httplib2
+
+    if not hasattr(_youtube_http, "http"):
+        _youtube_http.http = httplib2.Http(timeout=HTTP_TIMEOUT[1])
+    return HttpRequest(_youtube_http.http, *args, **kwargs)
+
+def get_youtube_client(api_key):
+    # Built once per key and process from the discovery document bundled with
+    # google-api-python-client, so no discovery request is made.
+    with _youtube_clients_lock:
+        youtube = _youtube_clients.get(api_key)
+        if youtube is None:
+            from googleapiclient.discovery import build
+
+            youtube = _youtube_clients[api_key] = build(
+                'youtube', 'v3', developerKey=api_key, requestBuilder=build_youtube_request,
+                static_discovery=True, cache_discovery=False,
+                client_options={"api_endpoint": YOUTUBE_API_ENDPOINT} if YOUTUBE_API_ENDPOINT else None
+            )
+        return youtube
+
+class RateLimiter:
+    # Token bucket: refills `rate` tokens per second up to `burst`. The bucket
+    # holds at least one token, or rates below 1/s could never fill it.
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = max(1, burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(api_key, rate):
+    # Last.fm limits are per API key, so every caller using a key shares one bucket.
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(api_key)
+        if limiter is None:
+            limiter = _rate_limiters[api_key] = RateLimiter(rate)
+        elif limiter.rate != rate:
+            if rate <= 0:
+                raise ValueError(f"rate must be positive, got {rate}")
+            limiter.rate = rate
+            limiter.burst = max(1, rate)
+        return limiter
+
+def guess_legacy_namespace(data):
+    # youtube_cache_fetch stored API resources, cache_get_or_fetch stored Last.fm replies.
+    return "youtube" if isinstance(data, dict) and ("items" in data or str(data.get("kind", "")).startswith("youtube#")) else "lastfm"
+
+class FileCache:
+    # Original layout: one cache/<md5>.json file per request, never expired.
+    # Newer namespaces are stored as cache/<namespace>-<key>.json so they
+    # cannot collide, and expire with their CACHE_TTLS entry by file age.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, namespace, key):
+        if namespace in FILE_CACHE_LEGACY_NAMESPACES:
+            return os.path.join(self.directory, key + ".json")
+        return os.path.join(self.directory, f"{namespace}-{key}.json")
+
+    @staticmethod
+    def parse_name(name):
+        # (namespace, key) for a cache file name, or (None, key) for files
+        # whose namespace has to be guessed from the payload.
+        stem = name[:-len(".json")]
+        namespace, sep, key = stem.partition("-")
+        if sep and namespace in CACHE_NAMESPACES and namespace not in FILE_CACHE_LEGACY_NAMESPACES:
+            return namespace, key
+        return None, stem
+
+    def get(self, namespace, key):
+        path = self._path(namespace, key)
+        if not os.path.exists(path):
+            return None
+        ttl = None if namespace in FILE_CACHE_LEGACY_NAMESPACES else CACHE_TTLS.get(namespace)
+        if ttl is not None and os.path.getmtime(path) + ttl < time.time():
+            os.remove(path)
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except ValueError as e:
+            # A torn write; drop it so the caller refetches instead of failing.
+            print(f"Discarding corrupt cache file {path}: {e}")
+            metrics.count("errors_total", stage="cache")
+            os.remove(path)
+            return None
+
+    def set(self, namespace, key, data):
+        with open(self._path(namespace, key), "w") as f:
             json.dump(data, f)
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json") and entry.name != QUOTA_FILE_NAME and entry.is_file():
+                yield entry
+
+    def _namespace(self, entry):
+        namespace, key = self.parse_name(entry.name)
+        if namespace:
+            return namespace
+        # Bare names carry no namespace; it is guessed from the name (request
+        # entries are md5 keys) and the payload.
+        try:
+            with open(entry.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return "unreadable"
+        if re.fullmatch(r"[0-9a-f]{32}\.json", entry.name):
+            return guess_legacy_namespace(data)
+        if "details_fetched" in data or "lastfm_fetched" in data:
+            return "tracks"
+        return "lastfm_index"
+
+    def stats(self):
+        # Hit counts are only kept by the SQLite store.
+        stats = {}
+        for entry in self._files():
+            namespace = self._namespace(entry)
+            row = stats.setdefault(namespace, {"namespace": namespace, "entries": 0, "bytes": 0, "hits": None, "misses": None, "oldest": None})
+            row["entries"] += 1
+            row["bytes"] += entry.stat().st_size
+            row["oldest"] = min(row["oldest"] or entry.stat().st_mtime, entry.stat().st_mtime)
+        return sorted(stats.values(), key=lambda row: row["namespace"])
+
+    def prune(self, max_age=None, max_bytes=None, namespaces=None):
+        files = sorted(self._files(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in files)
+        removed = 0
+        for entry in files:
+            if namespaces and self._namespace(entry) not in namespaces:
+                continue
+            too_old = max_age is not None and entry.stat().st_mtime < time.time() - max_age
+            too_big = max_bytes is not None and total > max_bytes
+            if not too_old and not too_big:
+                continue
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+            removed += 1
+        return removed
+
+    def verify(self, repair=False):
+        bad = []
+        for entry in self._files():
+            try:
+                with open(entry.path, "r") as f:
+                    json.load(f)
+            except (OSError, ValueError) as e:
+                namespace, key = self.parse_name(entry.name)
+                bad.append((namespace or "files", key, str(e)))
+                if repair:
+                    os.remove(entry.path)
+        return bad
+
+    def flush_stats(self):
+        pass
+
+class SqliteCache:
+    # Single-file store indexed by (namespace, key) with per-namespace TTLs
+    # and least-recently-used eviction once max_bytes of payload is reached.
+    def __init__(self, path, ttls=None, max_bytes=CACHE_MAX_BYTES, compress=True, import_legacy=True):
+        self.path = path
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.lock = threading.Lock()
+        is_new = not os.path.exists(path)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "compressed INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS stats ("
+            "namespace TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL)"
+        )
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        # Hit/miss counts are kept in memory and added to the stats table on
+        # exit, so lookups do not pay for an extra write.
+        self.counts = {}
+        atexit.register(self.flush_stats)
+        if is_new and import_legacy:
+            imported = self.import_directory(os.path.dirname(path) or ".")
+            if imported:
+                print(f"Imported {imported} legacy cache entries into {path}")
+
+    def _encode(self, data):
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        if self.compress:
+            return zlib.compress(payload), 1
+        return payload, 0
+
+    def _count(self, namespace, hit):
+        hits, misses = self.counts.get(namespace, (0, 0))
+        self.counts[namespace] = (hits + 1, misses) if hit else (hits, misses + 1)
+
+    def get(self, namespace, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, compressed, created FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                self._count(namespace, False)
+                return None
+            value, compressed, created = row
+            now = time.time()
+            ttl = self.ttls.get(namespace)
+            if ttl is not None and created + ttl < now:
+                self._delete(namespace, key)
+                self._count(namespace, False)
+                return None
+            try:
+                data = json.loads(zlib.decompress(value) if compressed else value)
+            except (zlib.error, ValueError) as e:
+                # Dropped so the caller refetches instead of failing the lookup.
+                print(f"Discarding corrupt cache entry {namespace}/{key}: {e}")
+                metrics.count("errors_total", stage="cache")
+                self._delete(namespace, key)
+                self._count(namespace, False)
+                return None
+            self.conn.execute(
+                "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key)
+            )
+            self._count(namespace, True)
         return data
 
+    def set(self, namespace, key, data, created=None):
+        value, compressed = self._encode(data)
+        now = time.time()
+        with self.lock:
+            self._delete(namespace, key)
+            self.conn.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (namespace, key, value, compressed, len(value), created or now, now)
+            )
+            self.size += len(value)
+            if self.max_bytes and self.size > self.max_bytes:
+                self._evict(int(self.max_bytes * CACHE_EVICT_TO))
+
+    def _delete(self, namespace, key):
+        row = self.conn.execute(
+            "SELECT size FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row:
+            self.conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self.size -= row[0]
+
+    def _evict(self, target):
+        rows = self.conn.execute("SELECT rowid, size FROM entries ORDER BY accessed")
+        evicted = []
+        for rowid, size in rows:
+            if self.size <= target:
+                break
+            evicted.append((rowid,))
+            self.size -= size
+        self.conn.executemany("DELETE FROM entries WHERE rowid = ?", evicted)
+
+    def flush_stats(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+            self.conn.executemany(
+                "INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT (namespace) "
+                "DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                [(namespace, hits, misses) for namespace, (hits, misses) in counts.items()]
+            )
+
+    def stats(self):
+        self.flush_stats()
+        with self.lock:
+            counts = {namespace: (hits, misses) for namespace, hits, misses in self.conn.execute("SELECT namespace, hits, misses FROM stats")}
+            rows = self.conn.execute(
+                "SELECT namespace, COUNT(*), SUM(size), MIN(created) FROM entries GROUP BY namespace"
+            ).fetchall()
+        stats = {namespace: {"namespace": namespace, "entries": 0, "bytes": 0, "hits": hits, "misses": misses, "oldest": None} for namespace, (hits, misses) in counts.items()}
+        for namespace, entries, size, oldest in rows:
+            hits, misses = counts.get(namespace, (0, 0))
+            stats[namespace] = {"namespace": namespace, "entries": entries, "bytes": size, "hits": hits, "misses": misses, "oldest": oldest}
+        return sorted(stats.values(), key=lambda row: row["namespace"])
+
+    def prune(self, max_age=None, max_bytes=None, namespaces=None):
+        # Entries past their namespace TTL are always dropped; max_age and
+        # max_bytes (least recently used first) trim further.
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute("SELECT rowid, namespace, size, created FROM entries ORDER BY accessed").fetchall()
+            removed = []
+            size = self.size
+            for rowid, namespace, entry_size, created in rows:
+                if namespaces and namespace not in namespaces:
+                    continue
+                ttl = self.ttls.get(namespace)
+                expired = ttl is not None and created + ttl < now
+                too_old = max_age is not None and created < now - max_age
+                too_big = max_bytes is not None and size > max_bytes
+                if expired or too_old or too_big:
+                    removed.append((rowid,))
+                    size -= entry_size
+            self.conn.executemany("DELETE FROM entries WHERE rowid = ?", removed)
+            self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if removed:
+                # Deleted rows only become free pages; give the space back to the disk.
+                self.conn.execute("VACUUM")
+        return len(removed)
+
+    def verify(self, repair=False):
+        # Decodes every entry; repair deletes the ones that fail so they are refetched.
+        bad = []
+        with self.lock:
+            result = self.conn.execute("PRAGMA integrity_check").fetchone()[0]
+            if result != "ok":
+                bad.append(("sqlite", os.path.basename(self.path), result))
+            rows = self.conn.execute("SELECT namespace, key, value, compressed, size FROM entries")
+            for namespace, key, value, compressed, size in rows:
+                try:
+                    if size != len(value):
+                        raise ValueError(f"stored size {size} does not match {len(value)} bytes")
+                    json.loads(zlib.decompress(value) if compressed else value)
+                except (zlib.error, ValueError) as e:
+                    bad.append((namespace, key, str(e)))
+            if repair:
+                for namespace, key, error in bad:
+                    if namespace != "sqlite":
+                        self._delete(namespace, key)
+        return bad
+
+    def import_directory(self, directory, remove=False):
+        # Migrate a FileCache directory; request entries are named by their md5
+        # keys, newer namespaces by <namespace>-<key>.
+        imported = 0
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            namespace, key = FileCache.parse_name(entry.name)
+            if namespace is None and not re.fullmatch(r"[0-9a-f]{32}", key):
+                continue
+            try:
+                with open(entry.path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable cache file {entry.path}: {e}")
+                continue
+            self.set(namespace or guess_legacy_namespace(data), key, data, created=entry.stat().st_mtime)
+            imported += 1
+            if remove:
+                os.remove(entry.path)
+        return imported
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if CACHE_BACKEND == "files":
+                _cache = FileCache(CACHE_DIR)
+            else:
+                _cache = SqliteCache(os.path.join(CACHE_DIR, CACHE_DB_NAME))
+        return _cache
+
+def configure_cache(backend):
+    global CACHE_BACKEND, _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.flush_stats()
+        CACHE_BACKEND = backend
+        _cache = None
+
+def cache_get_or_fetch(url, params, limiter=None, namespace="lastfm", is_miss=None):
+    # Replies that is_miss() flags are kept in "<namespace>_miss", which has a
+    # short TTL so failed lookups get retried instead of being cached for good.
+    cache = get_cache()
+    cache_key = hashlib.md5((url + json.dumps(params, sort_keys=True)).encode()).hexdigest()
+    data = cache.get(namespace, cache_key)
+    if data is None and is_miss:
+        data = cache.get(namespace + "_miss", cache_key)
+    metrics.count("cache_requests_total", namespace=namespace, result="miss" if data is None else "hit")
+    if data is None:
+        for attempt in range(HTTP_RETRIES + 1):
+            if limiter:
+                with metrics.stage("lastfm_rate_wait"):
+                    limiter.acquire()
+            response = http_get(url, upstream="lastfm", params=params)
+            response.raise_for_status()
+            data = response.json()
+            # Last.fm reports rate limiting and outages in the body with HTTP 200.
+            if data.get("error") not in LASTFM_TRANSIENT_ERRORS:
+                break
+            metrics.count("upstream_errors_total", upstream="lastfm", kind=f"lastfm_{data['error']}")
+            if attempt == HTTP_RETRIES:
+                raise RuntimeError(f"Last.fm error {data['error']}: {data.get('message', '')}")
+            metrics.count("upstream_retries_total", upstream="lastfm")
+            time.sleep(retry_delay(attempt))
+        cache.set(namespace + "_miss" if is_miss and is_miss(data) else namespace, cache_key, data)
+    return data
+
+def youtube_cache_key(request_name, params):
+    key = f"youtube::{request_name}::{json.dumps(params, sort_keys=True)}"
+    return hashlib.md5(key.encode()).hexdigest()
+
 def youtube_cache_fetch(service, request_func, params):
-    key = f"youtube::{request_func.__name__}::{json.dumps(params, sort_keys=True)}"
-    cache_key = hashlib.md5(key.encode()).hexdigest()
-    cache_path = os.path.join(CACHE_DIR, cache_key + ".json")
-    if os.path.exists(cache_path):
-        with open(cache_path, "r") as f:
-            return json.load(f)
-    else:
-        response = request_func(**params).execute()
-        with open(cache_path, "w") as f:
-            json.dump(response, f)
-        return response
+    cache = get_cache()
+    cache_key = youtube_cache_key(request_func.__name__, params)
+    response = cache.get("youtube", cache_key)
+    metrics.count("cache_requests_total", namespace="youtube", result="miss" if response is None else "hit")
+    if response is None:
+        response = execute_with_retry(request_func(**params))
+        cache.set("youtube", cache_key, response)
+    return response
+
+def fetch_video_details(youtube, video_ids, refresh=False):
+    # Each video is cached under the same key a single-ID videos().list call
+    # would use, so batches from different playlists share entries.
+    cache = get_cache()
+    # youtube.videos() builds a new resource object on every call, which costs
+    # more than the cache lookup itself; resolve the key prefix once.
+    request_name = youtube.videos().list.__name__
+    details = {}
+    missing = []
+    for video_id in dict.fromkeys(video_ids):
+        params = {'part': VIDEO_DETAILS_PART, 'id': video_id}
+        cached = None if refresh else cache.get("youtube", youtube_cache_key(request_name, params))
+        if cached is not None:
+            items = cached.get('items', [])
+            details[video_id] = items[0] if items else None
+        else:
+            missing.append(video_id)
+    metrics.count("cache_requests_total", len(details), namespace="youtube", result="hit")
+    metrics.count("cache_requests_total", len(missing), namespace="youtube", result="miss")
+
+    for start in range(0, len(missing), VIDEO_BATCH_SIZE):
+        chunk = missing[start:start + VIDEO_BATCH_SIZE]
+        try:
+            response = execute_with_retry(youtube.videos().list(
+                part=VIDEO_DETAILS_PART,
+                id=",".join(chunk),
+                maxResults=VIDEO_BATCH_SIZE
+            ))
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            metrics.count("errors_total", stage="video_details")
+            print(f"Error fetching video details: {e}")
+            continue
+        found = {item['id']: item for item in response.get('items', [])}
+        for video_id in chunk:
+            item = found.get(video_id)
+            details[video_id] = item
+            params = {'part': VIDEO_DETAILS_PART, 'id': video_id}
+            cache.set("youtube", youtube_cache_key(request_name, params), {'items': [item] if item else []})
+    return details
 
-def get_playlist_items(playlist_id, api_key, last_fm_api_key, last_fm_api_secret, output_dir, playlist_title, progress_state, progress_callback=None, no_music=False):
-    youtube = build('youtube', 'v3', developerKey=api_key)
-    video_ids = []
-    playlist_items = []
-    next_page_token = None
+def track_is_fresh(record, field, namespace):
+    # Track store fields expire with the cache namespace they were fetched from.
+    fetched = record.get(field)
+    ttl = CACHE_TTLS.get(namespace)
+    return fetched is not None and (ttl is None or fetched + ttl > time.time())
 
+def normalize_track(video_title, channel_title, topic=False, split=True):
+    # "Artist - Song (Official Video) [4K]" on an uploader's channel -> ("Artist", "Song").
+    # Topic channels title videos with the bare track name, so a dash there
+    # is part of the title unless it repeats the channel's artist.
+    title = TITLE_NOISE_RE.sub("", video_title).split(" | ")[0]
+    title = re.sub(r"\s+", " ", title).strip(" -")
+    title = TITLE_SUFFIX_NOISE_RE.sub("", title)
+    artist = CHANNEL_NOISE_RE.sub("", channel_title).strip() or channel_title
+    match = re.match(r"^(.+?)\s+[-\u2013\u2014]\s+(.+)$", title) if split else None
+    if match and (not topic or lookup_key(match.group(1)) == lookup_key(artist)):
+        artist, title = match.group(1).strip(), match.group(2).strip()
+    return artist, title.strip("\"'\u201c\u201d ") or title
+
+def lookup_key(text):
+    return re.sub(r"[\W_]+", "", text.casefold())
+
+def is_close_track(key, candidate):
+    # Titles that differ only in a number ("Part 1" / "Part 2") are different songs.
+    return (
+        re.findall(r"\d+", key) == re.findall(r"\d+", candidate)
+        and difflib.SequenceMatcher(None, key, candidate).ratio() >= TRACK_MATCH_CUTOFF
+    )
+
+_track_index_lock = threading.Lock()
+
+def track_index_find(artist, track):
+    # The index maps normalized artist -> normalized track -> the names Last.fm
+    # actually answered to, built from earlier successful lookups.
+    entries = get_cache().get("lastfm_index", lookup_key(artist))
+    metrics.count("cache_requests_total", namespace="lastfm_index", result="hit" if entries else "miss")
+    if not entries:
+        return None
+    key = lookup_key(track)
+    if key not in entries:
+        close = [candidate for candidate in entries if is_close_track(key, candidate)]
+        if not close:
+            return None
+        key = max(close, key=lambda candidate: difflib.SequenceMatcher(None, key, candidate).ratio())
+    return entries[key]
+
+def track_index_add(artist, track, found_artist, found_track):
+    cache = get_cache()
+    with _track_index_lock:
+        for artist_name, track_name in ((artist, track), (found_artist, found_track)):
+            artist_key = lookup_key(artist_name)
+            entries = cache.get("lastfm_index", artist_key) or {}
+            if entries.get(lookup_key(track_name)) != [found_artist, found_track]:
+                entries[lookup_key(track_name)] = [found_artist, found_track]
+                cache.set("lastfm_index", artist_key, entries)
+
+def lastfm_get_info(artist, track, last_fm_api_key, limiter):
+    params = {
+        "method": "track.getInfo",
+        "api_key": last_fm_api_key,
+        "artist": artist,
+        "track": track,
+        "format": "json"
+    }
+    return cache_get_or_fetch(LASTFM_API_URL, params, limiter=limiter, is_miss=lambda data: "track" not in data)
+
+def lastfm_search(artist, track, last_fm_api_key, limiter):
+    params = {
+        "method": "track.search",
+        "api_key": last_fm_api_key,
+        "artist": artist,
+        "track": track,
+        "limit": 1,
+        "format": "json"
+    }
+    data = cache_get_or_fetch(
+        LASTFM_API_URL, params, limiter=limiter,
+        is_miss=lambda data: not data.get("results", {}).get("trackmatches", {}).get("track")
+    )
+    matches = data.get("results", {}).get("trackmatches", {}).get("track", [])
+    if isinstance(matches, dict):
+        matches = [matches]
+    for match in matches:
+        # Search is loose; reject answers that are clearly a different song.
+        if is_close_track(lookup_key(track), lookup_key(match.get("name", ""))):
+            return match.get("artist", artist), match["name"]
+    return None
+
+def lastfm_lookup(video_title, channel_title, last_fm_api_key, limiter, topic=False):
+    artist, track = normalize_track(video_title, channel_title, topic)
+    known = track_index_find(artist, track)
+    if known:
+        data = lastfm_get_info(known[0], known[1], last_fm_api_key, limiter)
+        if "track" in data:
+            return data
+    data = lastfm_get_info(artist, track, last_fm_api_key, limiter)
+    if "track" not in data:
+        # The dash may have been part of the title after all; try the channel as the artist.
+        unsplit = normalize_track(video_title, channel_title, topic, split=False)
+        if unsplit != (artist, track):
+            data = lastfm_get_info(unsplit[0], unsplit[1], last_fm_api_key, limiter)
+            if "track" in data:
+                artist, track = unsplit
+    if "track" not in data:
+        found = lastfm_search(artist, track, last_fm_api_key, limiter)
+        if found:
+            data = lastfm_get_info(found[0], found[1], last_fm_api_key, limiter)
+    if "track" in data:
+        found_artist = data["track"].get("artist", {}).get("name") or artist
+        track_index_add(artist, track, found_artist, data["track"].get("name") or track)
+    return data
+
+def lastfm_track_info(video_title, channel_title, last_fm_api_key, limiter, topic=False):
+    tags = []
+    album_art_url = ""
+    try:
+        with metrics.stage("lastfm"):
+            data = lastfm_lookup(video_title, channel_title, last_fm_api_key, limiter, topic)
+        images = data.get("track", {}).get("album", {}).get("image", [])
+        if images:
+            large_image = next((img for img in reversed(images) if img.get("#text")), None)
+            if large_image:
+                album_art_url = large_image["#text"]
+        tag_data = data.get("track", {}).get("toptags", {}).get("tag", [])
+        tags = [tag["name"] for tag in tag_data if "name" in tag]
+    except Exception as e:
+        metrics.count("errors_total", stage="lastfm")
+        print(f"Error fetching Last.fm info for {channel_title} - {video_title}: {e}")
+    return tags, album_art_url
+
+def download_file(url, path):
+    # Stream into a temp file beside the target so readers never see a partial image.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for attempt in range(HTTP_RETRIES + 1):
+                try:
+                    with http_get(url, upstream="album_art", stream=True) as response:
+                        response.raise_for_status()
+                        f.seek(0)
+                        f.truncate()
+                        for chunk in response.iter_content(ALBUM_ART_CHUNK_SIZE):
+                            f.write(chunk)
+                    break
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                    # A body cut off mid-stream (a reset or a short read) is
+                    # restarted from scratch.
+                    if attempt == HTTP_RETRIES:
+                        raise
+                    metrics.count("upstream_retries_total", upstream="album_art")
+                    time.sleep(retry_delay(attempt))
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+_album_art_locks = {}
+_album_art_lock = threading.Lock()
+
+def album_art_asset_path(url):
+    # Every cover is downloaded once into the shared asset directory and
+    # linked into each playlist's album_art directory from there.
+    extension = os.path.splitext(sanitize_filename(os.path.basename(url)))[1]
+    return os.path.join(CACHE_DIR, ALBUM_ART_STORE_NAME, hashlib.md5(url.encode()).hexdigest() + extension)
+
+def link_or_copy(source, path):
+    try:
+        os.link(source, path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hardlinks across drives or on some filesystems; copy instead.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+def fetch_album_art(url, album_art_dir):
+    filename = sanitize_filename(os.path.basename(url))
+    if not filename:
+        raise ValueError(f"no file name in album art URL {url}")
+    path = os.path.join(album_art_dir, filename)
+    asset_path = album_art_asset_path(url)
+    with _album_art_lock:
+        url_lock = _album_art_locks.setdefault(url, threading.Lock())
+    # Holding the per-URL lock means concurrent playlists download a shared cover once.
+    with url_lock, metrics.stage("album_art"):
+        if not os.path.exists(path):
+            if not os.path.exists(asset_path):
+                os.makedirs(os.path.dirname(asset_path), exist_ok=True)
+                download_file(url, asset_path)
+            link_or_copy(asset_path, path)
+    return filename
+
+def album_art_store_files():
+    directory = os.path.join(CACHE_DIR, ALBUM_ART_STORE_NAME)
+    if not os.path.isdir(directory):
+        return []
+    return [entry for entry in os.scandir(directory) if entry.is_file()]
+
+def album_art_store_stats():
+    files = album_art_store_files()
+    return {
+        "namespace": ALBUM_ART_STORE_NAME,
+        "entries": len(files),
+        "bytes": sum(entry.stat().st_size for entry in files),
+        "hits": None,
+        "misses": None,
+        "oldest": min((entry.stat().st_mtime for entry in files), default=None)
+    }
+
+def prune_album_art_store(max_age=None, max_bytes=None):
+    # Playlists keep their own links to a cover, so removing it here only
+    # means the next playlist that uses it downloads it again.
+    files = sorted(album_art_store_files(), key=lambda entry: entry.stat().st_mtime)
+    total = sum(entry.stat().st_size for entry in files)
+    removed = 0
+    for entry in files:
+        too_old = max_age is not None and entry.stat().st_mtime < time.time() - max_age
+        too_big = max_bytes is not None and total > max_bytes
+        if not too_old and not too_big:
+            continue
+        total -= entry.stat().st_size
+        os.remove(entry.path)
+        removed += 1
+    return removed
+
+def verify_album_art_store(repair=False):
+    # Empty covers and .part files left behind by interrupted downloads.
+    bad = []
+    for entry in album_art_store_files():
+        if entry.name.endswith(".part"):
+            bad.append((ALBUM_ART_STORE_NAME, entry.name, "unfinished download"))
+        elif entry.stat().st_size == 0:
+            bad.append((ALBUM_ART_STORE_NAME, entry.name, "empty file"))
+        else:
+            continue
+        if repair:
+            os.remove(entry.path)
+    return bad
+
+def report_progress(progress_state, progress_callback=None):
+    # Overall progress, vps and ETA follow the writer; the per-stage counts
+    # in progress_state["stages"] are passed along for finer-grained display.
+    stages = progress_state["stages"]
+    done = stages["write"]["done"]
+    total = progress_state.get("total") or 0
+    elapsed = time.time() - progress_state["start_time"]
+    vps = done / elapsed if elapsed > 0 else 0
+    remaining = max(0, total - done)
+    eta_sec = int(remaining / vps) if vps > 0 else 0
+    progress_state["current_idx"] = done
+    progress_state["vps"] = vps
+    progress_state["eta"] = format_duration(eta_sec)
+    if progress_callback:
+        progress_callback(min(1.0, done / total) if total else 0.0, {name: dict(stage) for name, stage in stages.items()})
+
+def playlist_page(response):
+    return {
+        "etag": response.get("etag"),
+        "items": [
+            [item['snippet']['resourceId']['videoId'], item.get('etag')]
+            for item in response.get('items', [])
+        ],
+        "nextPageToken": response.get('nextPageToken'),
+        "totalResults": response.get('pageInfo', {}).get('totalResults')
+    }
+
+def iter_playlist_pages(youtube, playlist_id, page_token=None):
+    # Yields (token, page) for each playlistItems page, starting at page_token.
     while True:
         try:
             params = {
                 'part': 'snippet',
                 'playlistId': playlist_id,
                 'maxResults': 50,
-                'pageToken': next_page_token
+                'pageToken': page_token
             }
             response = youtube_cache_fetch(youtube, youtube.playlistItems().list, params)
-            video_ids.extend(item['snippet']['resourceId']['videoId'] for item in response.get('items', []))
-            next_page_token = response.get('nextPageToken')
-            if not next_page_token:
-                break
+            page = playlist_page(response)
+        except QuotaExhausted:
+            # Stopping here would silently truncate the playlist.
+            raise
         except Exception as e:
             print(f"Error fetching video IDs: {e}")
-            break
+            return
+        yield page_token or "", page
+        page_token = page["nextPageToken"]
+        if not page_token:
+            return
+
+def manifest_path_for(output_dir, playlist_id):
+    return os.path.join(output_dir, f".{sanitize_filename(playlist_id)}.manifest.json")
+
+def load_manifest(path, playlist_id):
+    empty = {"playlist_id": playlist_id, "pages": {}, "videos": {}}
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return empty
+    if manifest.get("playlist_id") != playlist_id:
+        return empty
+    return manifest
+
+def save_manifest(path, manifest):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+def iter_playlist_pages_revalidated(youtube, playlist_id, manifest, page_token=None):
+    # Pages are requested with If-None-Match; a 304 reuses the manifest copy.
+    from googleapiclient.errors import HttpError
+
+    while True:
+        token = page_token or ""
+        known = manifest["pages"].get(token)
+        request = youtube.playlistItems().list(
+            part='snippet',
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=page_token
+        )
+        if known:
+            request.headers["If-None-Match"] = known["etag"]
+        try:
+            page = playlist_page(execute_with_retry(request))
+        except HttpError as e:
+            if known and e.resp.status == 304:
+                page = known
+            else:
+                print(f"Error fetching video IDs: {e}")
+                return
+        except QuotaExhausted:
+            raise
+        except Exception as e:
+            print(f"Error fetching video IDs: {e}")
+            return
+        yield token, page
+        page_token = page["nextPageToken"]
+        if not page_token:
+            return
+
+def iter_playlist_items(playlist_id, api_key, last_fm_api_key, last_fm_api_secret, output_dir, playlist_title, progress_state, progress_callback=None, no_music=False, lastfm_workers=LASTFM_WORKERS, lastfm_rate=LASTFM_RATE_LIMIT, album_art_workers=ALBUM_ART_WORKERS, incremental=False, youtube=None, lastfm_executor=None, art_executor=None, written_entries=None, checkpoint=None):
+    # Runs as a pipeline: a pagination thread feeds pages to a details thread,
+    # which resolves them against the track store and the API and submits
+    # Last.fm lookups; finished lookups queue album art, and this generator
+    # yields entries in playlist order to the writer. The bounded queues
+    # between stages keep about ITEM_WINDOW items in flight.
+    if youtube is None:
+        youtube = get_youtube_client(api_key)
+    cache = get_cache()
+    # The entries already in the .part file, in playlist order.
+    written_entries = written_entries or []
+    written_ids = [entry["mainUrl"].rsplit("=", 1)[-1] for entry in written_entries]
+    item_etags = {}
+    pages = {}
+    if incremental:
+        manifest_path = manifest_path_for(output_dir, playlist_id)
+        manifest = load_manifest(manifest_path, playlist_id)
+    resuming = bool(checkpoint and checkpoint.state and checkpoint.state["video_ids"])
+    if resuming:
+        item_etags = dict(checkpoint.state["item_etags"])
+        pages = dict(checkpoint.state["pages"])
+    elif checkpoint:
+        checkpoint.start()
 
     album_art_dir = os.path.join(output_dir, "album_art")
     os.makedirs(album_art_dir, exist_ok=True)
-    total = len(video_ids)
+    album_art_prefix = f"Assets/Squirt/playlists/{sanitize_filename(playlist_title)}/album_art/"
+    manifest_videos = {}
+    art_futures = {}
+    album_art_files = {}
+    art_lock = threading.Lock()
+    # Items resolved by the details stage but not yet written, so repeats of a
+    # video share one lookup.
+    inflight = {}
+    inflight_lock = threading.Lock()
+    # Every Last.fm lookup submitted, so an early stop can cancel the queued ones.
+    lookups = []
+    stop = threading.Event()
+    page_queue = queue.Queue(maxsize=PIPELINE_PAGE_QUEUE)
+    item_queue = queue.Queue(maxsize=ITEM_WINDOW)
+    stages = {name: {"done": 0, "total": 0} for name in PIPELINE_STAGES}
+    progress_lock = threading.Lock()
     progress_state["start_time"] = time.time()
-    for idx, video_id in enumerate(video_ids):
-        try:
-            params = {
-                'part': 'snippet,contentDetails,statistics',
-                'id': video_id
-            }
-            video_response = youtube_cache_fetch(youtube, youtube.videos().list, params)
-            if video_response['items']:
-                video_info = video_response['items'][0]
-                video_title = video_info['snippet']['title']
-                channel_title = video_info['snippet']['channelTitle']
-                if " - topic" in channel_title.lower():
-                    channel_title = channel_title.replace(" - topic", "").replace(" - Topic", "").replace(" - TOPIC", "")
-                formatted_title = f"{video_title} - {channel_title}"
-                video_url_short = f'https://youtu.be/{video_id}'
-                video_url = f'https://www.youtube.com/watch?v={video_id}'
-
-                tags = []
-                album_art_relative_path = ""
-                if not no_music:
-                    params = {
-                        "method": "track.getInfo",
-                        "api_key": last_fm_api_key,
-                        "artist": channel_title,
-                        "track": video_title,
-                        "format": "json"
-                    }
-                    try:
-                        data = cache_get_or_fetch("http://ws.audioscrobbler.com/2.0/", params)
-                        images = data.get("track", {}).get("album", {}).get("image", [])
-                        if images:
-                            large_image = next((img for img in reversed(images) if img.get("#text")), None)
-                            if large_image:
-                                album_art_url = large_image["#text"]
-                                album_art_filename = os.path.basename(album_art_url)
-                                safe_album_art_filename = sanitize_filename(album_art_filename)
-                                album_art_path = os.path.join(album_art_dir, safe_album_art_filename)
-                                if not os.path.exists(album_art_path):
-                                    img_data = requests.get(album_art_url).content
-                                album_art_relative_path = f"Assets/Squirt/playlists/{sanitize_filename(playlist_title)}/album_art/{safe_album_art_filename}".replace("\\", "/")
-                        tag_data = data.get("track", {}).get("toptags", {}).get("tag", [])
-                        tags = [tag["name"] for tag in tag_data if "name" in tag]
-                    except Exception:
-                        pass
-
-                playlist_items.append({
-                    "mainUrl": video_url,
-                    "alternateUrl": video_url_short,
-                    "title": formatted_title,
-                    "description": "",
-                    "tags": ", ".join(tags),
-                    "image": album_art_relative_path
-                })
-            progress_state["current_title"] = video_title
-            progress_state["current_idx"] = idx + 1
+    progress_state["total"] = 0
+    progress_state["stages"] = stages
+
+    def advance(stage, count=1, title=None):
+        with progress_lock:
+            stages[stage]["done"] += count
+            if title:
+                progress_state["current_title"] = title
+            report_progress(progress_state, progress_callback)
+
+    def set_total(total):
+        with progress_lock:
             progress_state["total"] = total
-        except Exception as e:
-            print(f"Error fetching video details: {e}")
+            for name, stage in stages.items():
+                if name != "album_art":
+                    stage["total"] = total
+            report_progress(progress_state, progress_callback)
 
-        now = time.time()
-        elapsed = now - progress_state["start_time"]
-        done = idx + 1
-        vps = done / elapsed if elapsed > 0 else 0
-        remaining = total - done
-        eta_sec = int(remaining / vps) if vps > 0 else 0
-        eta_str = (
-            f"{eta_sec//60}:{eta_sec%60:02d}" if eta_sec < 3600
-            else f"{eta_sec//3600}:{(eta_sec%3600)//60:02d}:{eta_sec%60:02d}"
-        )
-        progress_state["vps"] = vps
-        progress_state["eta"] = eta_str
-        if progress_callback:
-            progress_callback(done / total)
-    return playlist_items
+    def put(target, item):
+        # Blocks while the next stage is full, unless the pipeline is torn down.
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=PIPELINE_POLL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def take(source):
+        while True:
+            try:
+                return source.get(timeout=PIPELINE_POLL)
+            except queue.Empty:
+                if stop.is_set():
+                    return PIPELINE_DONE
+
+    def queue_album_art(album_art_url):
+        # Lookups finishing after an early stop must not start downloads.
+        if album_art_url and not stop.is_set():
+            with art_lock:
+                if album_art_url in art_futures or album_art_url in album_art_files:
+                    return
+                future = art_futures[album_art_url] = art_executor.submit(fetch_album_art, album_art_url, album_art_dir)
+            with progress_lock:
+                stages["album_art"]["total"] += 1
+            future.add_done_callback(lambda f: advance("album_art"))
+
+    def on_lookup_done(future, title):
+        if stop.is_set():
+            return
+        # Start the cover download as soon as Last.fm names it.
+        queue_album_art(future.result()[1])
+        advance("lastfm", title=title)
+
+    def resolve_album_art(album_art_url):
+        if not album_art_url:
+            return ""
+        with art_lock:
+            future = art_futures.pop(album_art_url, None)
+        if future is not None:
+            try:
+                album_art_files[album_art_url] = future.result()
+            except Exception as e:
+                metrics.count("errors_total", stage="album_art")
+                print(f"Error downloading album art {album_art_url}: {e}")
+                album_art_files[album_art_url] = None
+        album_art_filename = album_art_files.get(album_art_url)
+        return (album_art_prefix + album_art_filename).replace("\\", "/") if album_art_filename else ""
+
+    def paginate():
+        try:
+            page_token = None
+            if resuming:
+                # Replay the IDs the checkpoint holds, then carry on paging if it stopped early.
+                video_ids = checkpoint.state["video_ids"]
+                complete = checkpoint.state.get("complete", True)
+                if complete:
+                    set_total(len(video_ids))
+                for start in range(0, len(video_ids), VIDEO_BATCH_SIZE):
+                    chunk = video_ids[start:start + VIDEO_BATCH_SIZE]
+                    advance("pagination", len(chunk))
+                    if not put(page_queue, chunk):
+                        return
+                if complete:
+                    return
+                page_token = checkpoint.state["next_page_token"]
+            if incremental:
+                page_iter = iter_playlist_pages_revalidated(youtube, playlist_id, manifest, page_token)
+            else:
+                page_iter = iter_playlist_pages(youtube, playlist_id, page_token)
+            while True:
+                # Only the page fetches are timed, not the waits on a full queue,
+                # so the stage shows YouTube's share of the run.
+                with metrics.stage("pagination"):
+                    fetched = next(page_iter, None)
+                if fetched is None:
+                    break
+                token, page = fetched
+                chunk = [video_id for video_id, etag in page["items"]]
+                if incremental:
+                    pages[token] = page
+                    item_etags.update(page["items"])
+                if checkpoint:
+                    checkpoint.add_page(
+                        chunk, page["nextPageToken"],
+                        item_etags=dict(page["items"]) if incremental else None,
+                        token=token, page=page if incremental else None
+                    )
+                if page.get("totalResults") and not progress_state["total"]:
+                    set_total(page["totalResults"])
+                advance("pagination", len(chunk))
+                if not put(page_queue, chunk):
+                    return
+            if checkpoint:
+                checkpoint.complete()
+            # totalResults can include private or deleted items; settle on what was paged.
+            set_total(stages["pagination"]["done"])
+        except BaseException as e:
+            put(page_queue, e)
+        finally:
+            put(page_queue, PIPELINE_DONE)
+
+    def resolve_waiting(waiting, shared):
+        # Fills shared with an item per waiting video: details come from the
+        # track store or one batched fetch, then Last.fm lookups are submitted.
+        with metrics.stage("video_details"):
+            details = fetch_video_details(youtube, [video_id for video_id, (record, fetch) in waiting.items() if fetch], refresh=incremental)
+        for video_id, (record, fetch) in waiting.items():
+            item = {"video_id": video_id, "kind": "track", "record": record, "changed": False, "lookup": None, "known": None}
+            if fetch:
+                try:
+                    if video_id not in details:
+                        raise LookupError(f"no details fetched for {video_id}")
+                    video_info = details[video_id]
+                    if not video_info:
+                        raise LookupError(f"video {video_id} is unavailable")
+                    video_title = video_info['snippet']['title']
+                    channel_title = video_info['snippet']['channelTitle']
+                    # Kept for the Last.fm lookup, which reads titles on Topic channels differently.
+                    topic = " - topic" in channel_title.lower()
+                    if topic:
+                        channel_title = channel_title.replace(" - topic", "").replace(" - Topic", "").replace(" - TOPIC", "")
+                    record.update(title=video_title, channel=channel_title, topic=topic, details_fetched=time.time())
+                    item["changed"] = True
+                except Exception as e:
+                    metrics.count("errors_total", stage="video_details")
+                    print(f"Error fetching video details: {e}")
+                    shared[video_id] = {"video_id": video_id, "kind": "skip"}
+                    continue
+            item["track"] = (record["title"], record["channel"])
+            if not no_music:
+                if track_is_fresh(record, "lastfm_fetched", "lastfm"):
+                    item["known"] = (record["tags"], record["album_art_url"])
+                    queue_album_art(record["album_art_url"])
+                else:
+                    item["lookup"] = lastfm_executor.submit(lastfm_track_info, *item["track"], last_fm_api_key, limiter, record.get("topic", False))
+                    lookups.append(item["lookup"])
+            with inflight_lock:
+                inflight[video_id] = item
+            shared[video_id] = item
+
+    def enrich():
+        # Pages are held back until they add up to a full videos batch, so
+        # sparse refetches (a warm track store, an incremental run) still
+        # share requests; pages with nothing to fetch go straight through.
+        buffered = []
+        reusable = {}
+        shared = {}
+        waiting = {}
+        written_pos = 0
+        try:
+            while True:
+                chunk = take(page_queue)
+                finished = not isinstance(chunk, list)
+                if not finished:
+                    # Written entries are matched by position, so a later
+                    # repeat of a written video is still resolved and written.
+                    # Unmatched IDs before the end of the written prefix are
+                    # videos an earlier run skipped.
+                    written_at = {}
+                    for offset, video_id in enumerate(chunk):
+                        if written_pos < len(written_ids) and written_ids[written_pos] == video_id:
+                            written_at[offset] = written_entries[written_pos]
+                            written_pos += 1
+                    buffered.append((chunk, written_at))
+                    for video_id in dict.fromkeys(video_id for offset, video_id in enumerate(chunk) if offset not in written_at):
+                        if video_id in reusable or video_id in shared or video_id in waiting:
+                            continue
+                        with inflight_lock:
+                            if video_id in inflight:
+                                shared[video_id] = inflight[video_id]
+                                continue
+                        if incremental:
+                            if video_id in manifest_videos:
+                                # A repeat of a video this run already wrote.
+                                reusable[video_id] = manifest_videos[video_id]["entry"]
+                                continue
+                            # Reuse entries whose playlist item is unchanged; everything else is refetched.
+                            known = manifest["videos"].get(video_id)
+                            etag = item_etags.get(video_id)
+                            if known and etag and known.get("etag") == etag:
+                                reusable[video_id] = known["entry"]
+                                continue
+                        # The track store answers for videos already seen in
+                        # any playlist; only unknown or stale fields are fetched.
+                        record = cache.get("tracks", video_id) or {}
+                        fetch = incremental or not track_is_fresh(record, "details_fetched", "youtube")
+                        metrics.count("cache_requests_total", namespace="tracks", result="miss" if fetch else "hit")
+                        waiting[video_id] = (record, fetch)
+                    need = sum(fetch for record, fetch in waiting.values())
+                    if need and need < VIDEO_BATCH_SIZE and sum(len(chunk_ids) for chunk_ids, written_at in buffered) < ITEM_WINDOW:
+                        continue
+                if buffered:
+                    resolve_waiting(waiting, shared)
+                    for chunk_ids, written_at in buffered:
+                        items = []
+                        for offset, video_id in enumerate(chunk_ids):
+                            if offset in written_at:
+                                # Already in the output file from an interrupted run.
+                                items.append({"video_id": video_id, "kind": "written", "entry": written_at[offset]})
+                            elif video_id in reusable:
+                                items.append({"video_id": video_id, "kind": "reused", "entry": reusable[video_id]})
+                            else:
+                                items.append(shared[video_id])
+                        advance("details", len(items))
+                        for item in items:
+                            # Progress for looked-up tracks is counted as each lookup
+                            # finishes, so vps/ETA follow the parallel Last.fm throughput.
+                            if item.get("lookup") is not None:
+                                item["lookup"].add_done_callback(lambda f, title=item["track"][0]: on_lookup_done(f, title))
+                            else:
+                                advance("lastfm")
+                            if not put(item_queue, item):
+                                return
+                    buffered = []
+                    reusable = {}
+                    shared = {}
+                    waiting = {}
+                if chunk is PIPELINE_DONE:
+                    return
+                if finished:
+                    put(item_queue, chunk)
+                    return
+        except BaseException as e:
+            put(item_queue, e)
+        finally:
+            put(item_queue, PIPELINE_DONE)
+
+    def build_entry(item):
+        video_id = item["video_id"]
+        video_title, channel_title = item["track"]
+        record = item["record"]
+        if item["lookup"] is not None:
+            tags, album_art_url = item["lookup"].result()
+            # Failed lookups are left for the Last.fm miss cache to retry.
+            if tags or album_art_url:
+                record.update(tags=tags, album_art_url=album_art_url, lastfm_fetched=time.time())
+                item["changed"] = True
+        elif item["known"] is not None:
+            tags, album_art_url = item["known"]
+        else:
+            tags, album_art_url = [], ""
+        # result() can return before the lookup's done callback has queued the cover.
+        queue_album_art(album_art_url)
+        image = resolve_album_art(album_art_url)
+        if image and record.get("album_art") != album_art_asset_path(album_art_url):
+            record["album_art"] = album_art_asset_path(album_art_url)
+            item["changed"] = True
+        if item["changed"]:
+            cache.set("tracks", video_id, record)
+        return {
+            "mainUrl": f'https://www.youtube.com/watch?v={video_id}',
+            "alternateUrl": f'https://youtu.be/{video_id}',
+            "title": f"{video_title} - {channel_title}",
+            "description": "",
+            "tags": ", ".join(tags),
+            "image": image
+        }
+
+    index = 0
+    with ExitStack() as stack:
+        if not no_music:
+            limiter = get_rate_limiter(last_fm_api_key, lastfm_rate)
+            # Batch runs pass shared executors so limits hold across playlists.
+            # The art pool is entered first so it shuts down after the lookups
+            # that feed it.
+            if art_executor is None:
+                art_executor = stack.enter_context(ThreadPoolExecutor(max_workers=album_art_workers))
+            if lastfm_executor is None:
+                lastfm_executor = stack.enter_context(ThreadPoolExecutor(max_workers=lastfm_workers))
+
+        threads = [threading.Thread(target=paginate, daemon=True), threading.Thread(target=enrich, daemon=True)]
+        for thread in threads:
+            thread.start()
+        written_left = len(written_entries)
+        try:
+            while True:
+                item = item_queue.get()
+                if item is PIPELINE_DONE:
+                    if written_left:
+                        raise ValueError(PARTIAL_MISMATCH_MESSAGE)
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                if checkpoint:
+                    # Runs once the consumer has written the previous entry.
+                    checkpoint.advance(index)
+                index += 1
+                video_id = item["video_id"]
+                with inflight_lock:
+                    if inflight.get(video_id) is item:
+                        del inflight[video_id]
+                if item["kind"] == "skip":
+                    advance("write")
+                    continue
+                if item["kind"] == "written":
+                    written_left -= 1
+                elif written_left:
+                    # The playlist changed since the .part file was written.
+                    raise ValueError(PARTIAL_MISMATCH_MESSAGE)
+                if "entry" not in item:
+                    item["entry"] = build_entry(item)
+                entry = item["entry"]
+                if incremental:
+                    manifest_videos[video_id] = {"etag": item_etags.get(video_id), "entry": entry}
+                advance("write", title=entry["title"])
+                if item["kind"] != "written":
+                    yield entry
+        finally:
+            # Lets the stage threads exit if the consumer stops early, then
+            # drops the lookups and downloads nobody will wait for. Futures
+            # already running finish; on a shared executor the other playlists
+            # no longer queue behind this one's leftovers.
+            stop.set()
+            for thread in threads:
+                thread.join()
+            for future in lookups:
+                future.cancel()
+            with art_lock:
+                for future in art_futures.values():
+                    future.cancel()
+
+    report_progress(progress_state, progress_callback)
+    if checkpoint:
+        checkpoint.advance(index)
+    if incremental:
+        # Removed videos are dropped simply by not carrying them over.
+        save_manifest(manifest_path, {
+            "playlist_id": playlist_id,
+            "pages": pages,
+            "videos": manifest_videos
+        })
+
+def checkpoint_path_for(output_dir, playlist_id):
+    return os.path.join(output_dir, f".{sanitize_filename(playlist_id)}.checkpoint.json")
+
+class Checkpoint:
+    # Records the video IDs paged so far (plus etags/pages for incremental
+    # runs), where paging stopped, and how far the writer has got. Completed
+    # entries themselves live in the PlaylistWriter .part file next to it.
+    def __init__(self, path, playlist_id, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.playlist_id = playlist_id
+        self.interval = interval
+        self.state = None
+        self.saved_at = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    state = json.load(f)
+                if state.get("playlist_id") == self.playlist_id:
+                    self.state = state
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+        return self.state
+
+    def start(self):
+        self.state = {
+            "playlist_id": self.playlist_id,
+            "video_ids": [],
+            "item_etags": {},
+            "pages": {},
+            "next_page_token": None,
+            "complete": False,
+            "index": 0
+        }
+        self.save()
+
+    def add_page(self, video_ids, next_page_token, item_etags=None, token=None, page=None):
+        # Called from the pagination thread while the writer keeps advancing.
+        with self.lock:
+            self.state["video_ids"].extend(video_ids)
+            if item_etags:
+                self.state["item_etags"].update(item_etags)
+            if page is not None:
+                self.state["pages"][token] = page
+            self.state["next_page_token"] = next_page_token
+
+    def complete(self):
+        with self.lock:
+            self.state["complete"] = True
+            self.state["next_page_token"] = None
+
+    def advance(self, index):
+        self.state["index"] = index
+        if time.time() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        if self.state is None:
+            return
+        with self.lock:
+            self.state["updated"] = time.time()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+        self.saved_at = time.time()
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def get_playlist_items(*args, **kwargs):
+    return list(iter_playlist_items(*args, **kwargs))
+
+def encode_compact(data):
+    # orjson is optional; without it the output is the same, just slower to produce.
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+class PlaylistWriter:
+    # Streams the playlist to <path>.part one entry at a time and renames it
+    # into place on a clean close. An interrupted .part file can be resumed.
+    # The protv format is byte-for-byte json.dump(create_json(...), indent=4);
+    # gzip is minified JSON in the .part file, compressed on close.
+    def __init__(self, path, header, resume=False, output_format="protv"):
+        self.path = path
+        self.tmp_path = path + ".part"
+        self.output_format = output_format
+        if output_format == "protv":
+            self.prefix = '{\n    "header": ' + json.dumps(header) + ',\n    "entries": ['
+        elif output_format == "ndjson":
+            self.prefix = encode_compact({"header": header}) + "\n"
+        else:
+            self.prefix = '{"header":' + encode_compact(header) + ',"entries":['
+        self.written = []
+        self.count = 0
+        if resume and os.path.exists(self.tmp_path):
+            entries, offset = read_partial_playlist(self.tmp_path, self.prefix)
+            if entries:
+                self.f = open(self.tmp_path, "r+", encoding="utf-8", newline="")
+                self.f.seek(offset)
+                self.f.truncate()
+                if output_format == "ndjson":
+                    # The offset stops at the closing brace, before the line break.
+                    self.f.write("\n")
+                self.written = entries
+                self.count = len(entries)
+                return
+        self.f = open(self.tmp_path, "w", encoding="utf-8", newline="")
+        self.f.write(self.prefix)
+
+    def write(self, entry):
+        with metrics.stage("write"):
+            if self.output_format == "protv":
+                self.f.write(("," if self.count else "") + "\n" + textwrap.indent(json.dumps(entry, indent=4), " " * 8))
+            elif self.output_format == "ndjson":
+                self.f.write(encode_compact(entry) + "\n")
+            else:
+                self.f.write(("," if self.count else "") + encode_compact(entry))
+            self.f.flush()
+        self.count += 1
+        metrics.count("entries_written_total")
+
+    def close(self):
+        with metrics.stage("write"):
+            if self.output_format == "protv":
+                self.f.write(("\n    ]" if self.count else "]") + "\n}")
+            elif self.output_format != "ndjson":
+                self.f.write("]}")
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+            if self.output_format == "gzip":
+                gz_path = self.tmp_path + ".gz"
+                with open(self.tmp_path, "rb") as source, open(gz_path, "wb") as target:
+                    with gzip.GzipFile(filename="", fileobj=target, mode="wb", compresslevel=OUTPUT_GZIP_LEVEL, mtime=0) as compressed:
+                        shutil.copyfileobj(source, compressed)
+                    target.flush()
+                    os.fsync(target.fileno())
+                os.replace(gz_path, self.path)
+                os.remove(self.tmp_path)
+            else:
+                os.replace(self.tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Keep the .part file so the next run can resume from it.
+            self.f.close()
+
+def read_partial_playlist(path, prefix):
+    # Returns the complete entries in a truncated .part file and the offset just past the last one.
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        text = f.read()
+    if not text.startswith(prefix):
+        return [], 0
+    decoder = json.JSONDecoder()
+    entries = []
+    pos = end = len(prefix)
+    while True:
+        while pos < len(text) and text[pos] in ", \r\n\t":
+            pos += 1
+        try:
+            entry, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            break
+        if not isinstance(entry, dict) or "mainUrl" not in entry:
+            break
+        entries.append(entry)
+        end = pos
+    return entries, len(text[:end].encode("utf-8"))
 
 def create_json(playlist_title, playlist_items):
     return {
@@ -269,7 +1965,421 @@ def create_json(playlist_title, playlist_items):
         "entries": playlist_items
     }
 
+def fetch_playlist_title(youtube, playlist_id):
+    params = {
+        'part': 'snippet',
+        'id': playlist_id
+    }
+    playlist_response = youtube_cache_fetch(youtube, youtube.playlists().list, params)
+    if not playlist_response.get('items'):
+        raise LookupError(f"Playlist {playlist_id} not found or not public")
+    return playlist_response['items'][0]['snippet']['title']
+
+def convert_playlist(youtube, playlist_id, output_dir, api_key, last_fm_api_key, last_fm_api_secret, progress_state, progress_callback=None, playlist_title=None, resume=False, output_format="protv", **options):
+    os.makedirs(output_dir, exist_ok=True)
+    if playlist_title is None:
+        playlist_title = fetch_playlist_title(youtube, playlist_id)
+    json_path = os.path.join(output_dir, sanitize_filename(playlist_title) + OUTPUT_FORMATS[output_format])
+    checkpoint = Checkpoint(checkpoint_path_for(output_dir, playlist_id), playlist_id)
+    if resume and checkpoint.load():
+        print(f"Resuming {playlist_id} from checkpoint at item {checkpoint.state['index']} of {len(checkpoint.state['video_ids'])}")
+    try:
+        with PlaylistWriter(json_path, playlist_title, resume=resume, output_format=output_format) as writer:
+            if writer.count:
+                print(f"Resuming {json_path} after {writer.count} written entries")
+            for entry in iter_playlist_items(
+                playlist_id, api_key, last_fm_api_key, last_fm_api_secret,
+                output_dir, playlist_title, progress_state,
+                progress_callback=progress_callback, youtube=youtube,
+                written_entries=writer.written, checkpoint=checkpoint, **options
+            ):
+                writer.write(entry)
+    except BaseException:
+        checkpoint.save()
+        raise
+    checkpoint.clear()
+    return playlist_title, json_path, writer.count
+
+def project_quota(youtube, playlist_ids):
+    # Upper bound: a title lookup per playlist plus one playlistItems page and
+    # one videos batch per 50 items. Cache hits make the real figure lower.
+    item_counts = {}
+    unique_ids = list(dict.fromkeys(playlist_ids))
+    for start in range(0, len(unique_ids), 50):
+        response = execute_with_retry(youtube.playlists().list(
+            part='contentDetails',
+            id=",".join(unique_ids[start:start + 50]),
+            maxResults=50
+        ))
+        for item in response.get('items', []):
+            item_counts[item['id']] = item['contentDetails']['itemCount']
+    units = sum(1 + 2 * math.ceil(item_counts.get(playlist_id, 0) / VIDEO_BATCH_SIZE) for playlist_id in unique_ids)
+    return units, item_counts
+
+def report_quota_projection(youtube, playlist_ids):
+    quota = get_quota_tracker()
+    # The projection spends quota itself; with none left, the run reports
+    # or defers the shortfall on its own.
+    try:
+        if not quota.remaining():
+            raise QuotaExhausted("no quota left for the projection")
+        units, item_counts = project_quota(youtube, playlist_ids)
+    except QuotaExhausted:
+        print("Skipping the quota projection: the YouTube quota budget is used up for today")
+        print(quota.summary())
+        return None
+    print(f"Projected YouTube quota: up to {units} units for {sum(item_counts.values())} items in {len(item_counts)} playlists")
+    print(quota.summary())
+    if units > quota.remaining():
+        action = "wait for the daily reset" if quota.wait else "stop and can be continued with --resume"
+        print(f"Warning: projected use exceeds the {quota.remaining()} units left today; the run will {action} when the budget runs out")
+    return units
+
+def read_playlist_ids(path):
+    with open(path, "r") as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+def output_dir_key(playlist_title):
+    # Playlists are written to a directory named after their title; Windows
+    # paths ignore case, so titles differing only in case collide too.
+    return sanitize_filename(playlist_title).lower()
+
+def shared_output_dirs(titles):
+    # Playlists that would write the same .playlist are refused together.
+    owners = {}
+    for playlist_id, title in titles.items():
+        owners.setdefault(output_dir_key(title), []).append(playlist_id)
+    return {playlist_id: ids for ids in owners.values() if len(ids) > 1 for playlist_id in ids}
+
+def batch_executors(parallel_playlists=BATCH_PARALLEL_PLAYLISTS, **options):
+    # The playlist, Last.fm and album art pools of a batch, prefetch or the
+    # service. Every playlist shares them, so the configured worker counts are
+    # global limits rather than per-playlist ones.
+    return (
+        ThreadPoolExecutor(max_workers=parallel_playlists),
+        ThreadPoolExecutor(max_workers=options.get("lastfm_workers", LASTFM_WORKERS)),
+        ThreadPoolExecutor(max_workers=options.get("album_art_workers", ALBUM_ART_WORKERS))
+    )
+
+@contextmanager
+def shared_executors(parallel_playlists=BATCH_PARALLEL_PLAYLISTS, **options):
+    executors = batch_executors(parallel_playlists, **options)
+    try:
+        yield executors
+    finally:
+        # Playlists first: they are what waits on the lookups and downloads.
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+def run_batch(youtube, playlist_ids, output_dir, api_key, last_fm_api_key, last_fm_api_secret, parallel_playlists=BATCH_PARALLEL_PLAYLISTS, **options):
+    # Every playlist shares the client, cache and worker pools.
+    results = []
+    start = time.time()
+    playlist_ids = list(dict.fromkeys(playlist_ids))
+    with shared_executors(parallel_playlists, **options) as (playlist_executor, lastfm_executor, art_executor):
+        def title_or_error(playlist_id):
+            try:
+                return fetch_playlist_title(youtube, playlist_id)
+            except Exception as e:
+                return e
+
+        # Titles are fetched up front so playlists that would share an output
+        # directory are caught before any of them writes.
+        titles = dict(zip(playlist_ids, playlist_executor.map(title_or_error, playlist_ids)))
+        collisions = shared_output_dirs({playlist_id: title for playlist_id, title in titles.items() if isinstance(title, str)})
+
+        def convert_one(playlist_id):
+            started = time.time()
+            try:
+                playlist_title = titles[playlist_id]
+                if isinstance(playlist_title, Exception):
+                    raise playlist_title
+                if playlist_id in collisions:
+                    others = ", ".join(other for other in collisions[playlist_id] if other != playlist_id)
+                    raise ValueError(f"'{playlist_title}' has the same output directory as {others}; convert them into separate --output directories")
+                # Each playlist gets its own directory to match its Assets/.../playlists/<title>/ path.
+                playlist_dir = os.path.join(output_dir, sanitize_filename(playlist_title))
+                playlist_title, json_path, count = convert_playlist(
+                    youtube, playlist_id, playlist_dir, api_key, last_fm_api_key, last_fm_api_secret,
+                    {"progress": 0.0}, playlist_title=playlist_title,
+                    lastfm_executor=lastfm_executor, art_executor=art_executor, **options
+                )
+                print(f"Converted {playlist_id} ({count} items) -> {json_path}")
+                return {"playlist_id": playlist_id, "title": playlist_title, "items": count, "path": json_path, "error": None, "seconds": time.time() - started, "deferred": False}
+            except Exception as e:
+                print(f"Error converting {playlist_id}: {e}")
+                return {"playlist_id": playlist_id, "title": "", "items": 0, "path": "", "error": str(e), "seconds": time.time() - started, "deferred": isinstance(e, QuotaExhausted)}
+
+        for result in playlist_executor.map(convert_one, playlist_ids):
+            results.append(result)
+
+    elapsed = time.time() - start
+    failed = [result for result in results if result["error"]]
+    total_items = sum(result["items"] for result in results)
+    print(f"\nBatch summary: {len(results)} playlists, {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    print(f"{total_items} items in {elapsed:.1f}s ({total_items / elapsed if elapsed > 0 else 0:.2f} items/sec)")
+    for result in results:
+        if result["deferred"]:
+            print(f"  WAIT  {result['playlist_id']}  deferred until the quota resets; re-run with --resume")
+        elif result["error"]:
+            print(f"  FAIL  {result['playlist_id']}  {result['error']}")
+        else:
+            print(f"  OK    {result['playlist_id']}  {result['items']} items in {result['seconds']:.1f}s  {result['title']}")
+    return results
+
+def prefetch_playlists(youtube, playlist_ids, api_key, last_fm_api_key, last_fm_api_secret, parallel_playlists=BATCH_PARALLEL_PLAYLISTS, **options):
+    # Runs the conversion pipeline and throws the entries away, leaving the
+    # request cache, track store and album art store warm for real runs.
+    results = []
+    with shared_executors(parallel_playlists, **options) as (playlist_executor, lastfm_executor, art_executor), \
+            tempfile.TemporaryDirectory() as scratch_dir:
+        def prefetch_one(playlist_id):
+            try:
+                playlist_title = fetch_playlist_title(youtube, playlist_id)
+                count = 0
+                for entry in iter_playlist_items(
+                    playlist_id, api_key, last_fm_api_key, last_fm_api_secret,
+                    os.path.join(scratch_dir, sanitize_filename(playlist_id)), playlist_title, {"progress": 0.0},
+                    youtube=youtube, lastfm_executor=lastfm_executor, art_executor=art_executor, **options
+                ):
+                    count += 1
+                print(f"Prefetched {playlist_id} ({count} items)  {playlist_title}")
+                return {"playlist_id": playlist_id, "items": count, "error": None, "deferred": False}
+            except Exception as e:
+                print(f"Error prefetching {playlist_id}: {e}")
+                return {"playlist_id": playlist_id, "items": 0, "error": str(e), "deferred": isinstance(e, QuotaExhausted)}
+
+        for result in playlist_executor.map(prefetch_one, dict.fromkeys(playlist_ids)):
+            results.append(result)
+
+    deferred = [result for result in results if result["deferred"]]
+    failed = [result for result in results if result["error"] and not result["deferred"]]
+    print(f"\nPrefetch summary: {len(results)} playlists, {sum(result['items'] for result in results)} items cached, {len(failed)} failed")
+    if deferred:
+        # Everything fetched so far is cached, so the next window picks up where this one stopped.
+        print(f"{len(deferred)} playlists ran out of quota; run the prefetch again after the daily reset")
+    return results
+
+class ConversionService:
+    # Job queue behind --serve. Every job shares the YouTube client, cache and
+    # the playlist/Last.fm/art pools, so a warm process serves all requests.
+    def __init__(self, youtube, output_dir, api_key, last_fm_api_key, last_fm_api_secret, parallel_playlists=BATCH_PARALLEL_PLAYLISTS, **options):
+        self.youtube = youtube
+        self.output_dir = output_dir
+        self.keys = (api_key, last_fm_api_key, last_fm_api_secret)
+        self.options = options
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # Output directory key -> the job writing it.
+        self.output_dirs = {}
+        self.playlist_executor, self.lastfm_executor, self.art_executor = batch_executors(parallel_playlists, **options)
+
+    def submit(self, playlist_id, /, **job_options):
+        for name, value in job_options.items():
+            # bool("false") is True, so anything but a real boolean is refused.
+            if name not in SERVICE_JOB_OPTIONS:
+                raise ValueError(f"unknown option {name!r}; expected {', '.join(SERVICE_JOB_OPTIONS)}")
+            if not isinstance(value, bool):
+                raise ValueError(f"{name} must be true or false, got {value!r}")
+        with self.lock:
+            # Two jobs writing the same output directory would corrupt it.
+            for job in self.jobs.values():
+                if job["playlist_id"] == playlist_id and job["status"] in ("queued", "running"):
+                    return job
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "playlist_id": playlist_id,
+                "options": {name: job_options.get(name, bool(self.options.get(name, False))) for name in SERVICE_JOB_OPTIONS},
+                "status": "queued",
+                "title": "",
+                "path": "",
+                "items": 0,
+                "error": None,
+                "submitted": time.time(),
+                "started": None,
+                "finished": None,
+                "progress_state": {"progress": 0.0}
+            }
+            self.jobs[job["id"]] = job
+            self._prune()
+        self.playlist_executor.submit(self._run, job)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self.jobs.values() if job["finished"]]
+        for job in sorted(finished, key=lambda job: job["finished"])[:max(0, len(self.jobs) - SERVICE_MAX_JOBS)]:
+            del self.jobs[job["id"]]
+
+    def _run(self, job):
+        job["status"] = "running"
+        job["started"] = time.time()
+        progress_state = job["progress_state"]
+        dir_key = None
+        try:
+            playlist_title = fetch_playlist_title(self.youtube, job["playlist_id"])
+            job["title"] = playlist_title
+            # submit() only dedupes by playlist ID, but the directory comes
+            # from the title; a different playlist writing it would corrupt it.
+            with self.lock:
+                owner = self.output_dirs.setdefault(output_dir_key(playlist_title), job)
+                if owner is job:
+                    dir_key = output_dir_key(playlist_title)
+            if owner is not job:
+                raise ValueError(f"'{playlist_title}' has the same output directory as job {owner['id']} ({owner['playlist_id']}), which is still running")
+            options = dict(self.options, **job["options"])
+            job["title"], job["path"], job["items"] = convert_playlist(
+                self.youtube, job["playlist_id"], os.path.join(self.output_dir, sanitize_filename(playlist_title)), *self.keys,
+                progress_state, progress_callback=lambda progress, stages: progress_state.update(progress=progress),
+                playlist_title=playlist_title, lastfm_executor=self.lastfm_executor, art_executor=self.art_executor, **options
+            )
+            job["status"] = "done"
+        except QuotaExhausted as e:
+            job["error"] = str(e)
+            job["status"] = "deferred"
+        except Exception as e:
+            print(f"Error converting {job['playlist_id']}: {e}")
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            if dir_key is not None:
+                with self.lock:
+                    del self.output_dirs[dir_key]
+            job["finished"] = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def describe(self, job):
+        progress_state = job["progress_state"]
+        return {
+            "id": job["id"],
+            "playlist_id": job["playlist_id"],
+            "status": job["status"],
+            "options": job["options"],
+            "title": job["title"],
+            "items": job["items"],
+            "error": job["error"],
+            "submitted": job["submitted"],
+            "started": job["started"],
+            "finished": job["finished"],
+            "progress": {
+                name: progress_state.get(name)
+                for name in ("progress", "current_idx", "total", "current_title", "vps", "eta", "stages")
+            },
+            "playlist": f"/jobs/{job['id']}/playlist" if job["status"] == "done" else None
+        }
+
+    def describe_all(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [self.describe(job) for job in sorted(jobs, key=lambda job: job["submitted"])]
+
+    def shutdown(self):
+        # Queued jobs are dropped; running ones finish (or can be resubmitted with resume).
+        self.playlist_executor.shutdown(wait=True, cancel_futures=True)
+        self.lastfm_executor.shutdown(wait=True)
+        self.art_executor.shutdown(wait=True)
+
+def run_server(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        def send_json(self, data, status=200, headers=None):
+            body = json.dumps(data, indent=4).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_json(self, status, message):
+            self.send_json({"error": message}, status=status)
+
+        def do_GET(self):
+            parts = self.path.split("?", 1)[0].strip("/").split("/")
+            if parts == ["jobs"]:
+                return self.send_json(service.describe_all())
+            if parts == ["metrics"]:
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if len(parts) not in (2, 3) or parts[0] != "jobs" or (len(parts) == 3 and parts[2] != "playlist"):
+                return self.send_error_json(404, "not found")
+            job = service.get(parts[1])
+            if job is None:
+                return self.send_error_json(404, f"no job {parts[1]}")
+            if len(parts) == 2:
+                return self.send_json(service.describe(job))
+            if job["status"] != "done":
+                return self.send_error_json(409, f"job {job['id']} is {job['status']}")
+            try:
+                with open(job["path"], "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    self.send_response(200)
+                    if job["path"].endswith(".gz"):
+                        self.send_header("Content-Type", "application/gzip")
+                    elif job["path"].endswith(".ndjson"):
+                        self.send_header("Content-Type", "application/x-ndjson")
+                    else:
+                        self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(size))
+                    self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(job["path"])}"')
+                    self.end_headers()
+                    shutil.copyfileobj(f, self.wfile)
+            except FileNotFoundError:
+                self.send_error_json(410, f"{job['path']} no longer exists")
+
+        def do_POST(self):
+            if self.path.split("?", 1)[0].strip("/") != "jobs":
+                return self.send_error_json(404, "not found")
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                playlist_id = request["playlist_id"]
+                if not isinstance(playlist_id, str) or not re.fullmatch(r"[A-Za-z0-9_-]+", playlist_id):
+                    raise ValueError(f"invalid playlist_id {playlist_id!r}")
+            except (KeyError, TypeError, ValueError) as e:
+                return self.send_error_json(400, f"expected a JSON body like {{\"playlist_id\": \"PL...\"}}: {e}")
+            try:
+                # Everything but the ID goes to submit(), which refuses unknown
+                # or misspelled options rather than ignoring them.
+                job = service.submit(playlist_id, **{name: value for name, value in request.items() if name != "playlist_id"})
+            except ValueError as e:
+                return self.send_error_json(400, str(e))
+            self.send_json(service.describe(job), status=202, headers={"Location": f"/jobs/{job['id']}"})
+
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    print(f"Serving playlist conversions on http://{host}:{server.server_port} (POST /jobs, GET /jobs/<id>, GET /jobs/<id>/playlist)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping; waiting for running jobs to finish")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+def rainbow_palette(size):
+    import colorsys
+
+    colors = []
+    for i in range(size):
+        r, g, b = [int(x * 255) for x in colorsys.hsv_to_rgb(i / size, 1, 1)]
+        colors.append(f'#{r:02x}{g:02x}{b:02x}')
+    return colors
+
 def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
+
     CANVAS_WIDTH = 600
 
     def browse_output():
@@ -291,7 +2401,7 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
 
     root = tk.Tk()
     root.title("YouTube Playlist to ProTV Playlist Converter")
-    root.geometry("640x250")
+    root.geometry("640x275")
     root.resizable(False, False)
 
     playlist_id = tk.StringVar()
@@ -311,7 +2421,9 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
     ttk.Button(output_frame, text="Browse", command=browse_output).pack(side=tk.RIGHT, padx=(5, 0))
 
     no_music_mode = tk.BooleanVar(value=False)
-    ttk.Checkbutton(main_frame, text="Non-music mode (skip Last.fm)", variable=no_music_mode).pack(anchor=tk.W, pady=(0, 10))
+    ttk.Checkbutton(main_frame, text="Non-music mode (skip Last.fm)", variable=no_music_mode).pack(anchor=tk.W)
+    resume_mode = tk.BooleanVar(value=False)
+    ttk.Checkbutton(main_frame, text="Resume interrupted conversion", variable=resume_mode).pack(anchor=tk.W, pady=(0, 10))
 
     status_label = ttk.Label(main_frame, text="Ready to convert")
 
@@ -325,71 +2437,87 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
         "total": 0
     }
 
-    def draw_songinfo_animated():
-        songinfo_canvas.delete("all")
-        now = time.time()
+    # Colours come from one precomputed palette and every canvas item is
+    # created once; each frame only moves or recolours existing items.
+    palette = rainbow_palette(CANVAS_WIDTH)
+    max_chars = CANVAS_WIDTH // GUI_CHAR_WIDTH
+
+    def make_rainbow_text(canvas):
+        items = [
+            canvas.create_text(0, GUI_TEXT_Y, text="", font=GUI_FONT, anchor="w")
+            for _ in range(max_chars)
+        ]
+        return {"canvas": canvas, "items": items, "text": "", "x": None, "shift": None}
+
+    def update_rainbow_text(row, text, x, shift):
+        canvas = row["canvas"]
+        old_text = row["text"]
+        if text != old_text or x != row["x"]:
+            for i, item in enumerate(row["items"]):
+                char = text[i] if i < len(text) else ""
+                if char != (old_text[i] if i < len(old_text) else ""):
+                    canvas.itemconfigure(item, text=char)
+                if x != row["x"]:
+                    canvas.coords(item, x + i * GUI_CHAR_WIDTH, GUI_TEXT_Y)
+            row["text"], row["x"], row["shift"] = text, x, None
+        if shift != row["shift"]:
+            length = max(1, len(text))
+            for i in range(len(text)):
+                canvas.itemconfigure(row["items"][i], fill=palette[(i * CANVAS_WIDTH // length + shift) % CANVAS_WIDTH])
+            row["shift"] = shift
+
+    songinfo_row = make_rainbow_text(songinfo_canvas)
+    stats_row = make_rainbow_text(stats_canvas)
+
+    # The bar is a prerendered two-period rainbow strip slid left under a
+    # mask, instead of one canvas line per pixel.
+    bar_height = 24
+    rainbow_strip = tk.PhotoImage(width=CANVAS_WIDTH * 2, height=bar_height)
+    strip_row = "{" + " ".join(palette + palette) + "}"
+    rainbow_strip.put(" ".join([strip_row] * bar_height), to=(0, 0))
+    strip_item = progress_canvas.create_image(0, 0, image=rainbow_strip, anchor="nw")
+    bar_mask = progress_canvas.create_rectangle(0, 0, CANVAS_WIDTH, bar_height, fill="#222", outline="#222")
+
+    def songinfo_text():
         title = progress_state.get("current_title", "")
-        idx = progress_state.get("current_idx", 0)
-        total = progress_state.get("total", 0)
-        char_width = 13
-        max_width = CANVAS_WIDTH - 20
-        if title:
-            base_str = f"{idx}/{total}   "
-            available_chars = (max_width // char_width) - len(base_str)
-            if available_chars < 4:
-                display_title = ""
-            elif len(title) > available_chars:
-                display_title = title[:available_chars - 3] + "..."
-            else:
-                display_title = title
-            info_str = base_str + display_title
+        if not title:
+            return ""
+        base_str = f"{progress_state.get('current_idx', 0)}/{progress_state.get('total', 0)}   "
+        available_chars = ((CANVAS_WIDTH - 20) // GUI_CHAR_WIDTH) - len(base_str)
+        if available_chars < 4:
+            display_title = ""
+        elif len(title) > available_chars:
+            display_title = title[:available_chars - 3] + "..."
         else:
-            info_str = ""
-        bar_x = 10
-        info_y = 14
-        for i, char in enumerate(info_str):
-            hue = (i / max(1, len(info_str)) + now / 2) % 1.0
-            r, g, b = [int(x * 255) for x in colorsys.hsv_to_rgb(hue, 1, 1)]
-            color = f'#{r:02x}{g:02x}{b:02x}'
-            songinfo_canvas.create_text(bar_x + i * char_width, info_y, text=char, fill=color, font=("Segoe UI", 12, "bold"), anchor="w")
-        songinfo_canvas.after(50, draw_songinfo_animated)
-
-    def draw_rainbow_bar_animated():
-        progress = progress_state["progress"]
-        width = CANVAS_WIDTH
-        height = 24
-        progress_canvas.delete("all")
-        bar_width = int(width * progress)
-        now = time.time()
-        bar_x = 0
-        for i in range(bar_width):
-            hue = (i / width + now / 2) % 1.0
-            r, g, b = [int(x * 255) for x in colorsys.hsv_to_rgb(hue, 1, 1)]
-            color = f'#{r:02x}{g:02x}{b:02x}'
-            progress_canvas.create_line(bar_x + i, 0, bar_x + i, height, fill=color)
-        if bar_width < width:
-            progress_canvas.create_rectangle(bar_x + bar_width, 0, bar_x + width, height, fill="#222", outline="#222")
-        progress_canvas.after(50, draw_rainbow_bar_animated)
-
-    def draw_stats_animated():
-        width = CANVAS_WIDTH
-        stats_canvas.delete("all")
-        now = time.time()
+            display_title = title
+        return (base_str + display_title)[:max_chars]
+
+    def stats_text():
         percent = int(progress_state.get("progress", 0.0) * 100)
-        percent_str = f"{percent:3d}%"
         vps = progress_state.get("vps", 0.0)
         eta = progress_state.get("eta", "")
-        stats_str = f"{percent_str}   {vps:.2f} videos/sec   ETA: {eta}"
-        char_width = 13
-        total_str_px = len(stats_str) * char_width
-        bar_x = (width - total_str_px) // 2
-        stats_y = 14
-        for i, char in enumerate(stats_str):
-            hue = (i / max(1, len(stats_str)) + now / 2) % 1.0
-            r, g, b = [int(x * 255) for x in colorsys.hsv_to_rgb(hue, 1, 1)]
-            color = f'#{r:02x}{g:02x}{b:02x}'
-            stats_canvas.create_text(bar_x + i * char_width, stats_y, text=char, fill=color, font=("Segoe UI", 12, "bold"), anchor="w")
-        stats_canvas.after(50, draw_stats_animated)
+        return f"{percent:3d}%   {vps:.2f} videos/sec   ETA: {eta}"[:max_chars]
+
+    last_frame = {"state": None}
+
+    def animate():
+        # Nothing is drawn until the progress canvases are shown, and nothing
+        # is redrawn until the progress shown on them changes; the rainbow
+        # moves on with the next update.
+        if progress_canvas.winfo_ismapped():
+            songinfo, stats = songinfo_text(), stats_text()
+            bar_width = int(CANVAS_WIDTH * progress_state["progress"])
+            state = (songinfo, stats, bar_width)
+            if state != last_frame["state"]:
+                last_frame["state"] = state
+                with metrics.stage("gui_frame"):
+                    phase = (time.time() / 2) % 1.0
+                    hue_shift = int(phase * GUI_HUE_STEPS) * CANVAS_WIDTH // GUI_HUE_STEPS
+                    update_rainbow_text(songinfo_row, songinfo, 10, hue_shift)
+                    update_rainbow_text(stats_row, stats, (CANVAS_WIDTH - len(stats) * GUI_CHAR_WIDTH) // 2, hue_shift)
+                    progress_canvas.coords(strip_item, -int(phase * CANVAS_WIDTH), 0)
+                    progress_canvas.coords(bar_mask, bar_width, 0, CANVAS_WIDTH, bar_height)
+        root.after(GUI_FRAME_MS, animate)
 
     def do_conversion(playlist, output):
         try:
@@ -399,30 +2527,16 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
             status_label.config(text="Converting... Please wait...")
             root.update_idletasks()
 
-            os.makedirs(output, exist_ok=True)
-            youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
-            params = {
-                'part': 'snippet',
-                'id': playlist
-            }
-            playlist_response = youtube_cache_fetch(youtube, youtube.playlists().list, params)
-            playlist_title = playlist_response['items'][0]['snippet']['title']
-            sanitized_title = sanitize_filename(playlist_title)
-
             progress_state["progress"] = 0.0
 
-            playlist_items = get_playlist_items(
-                playlist, YOUTUBE_API_KEY, LASTFM_API_KEY, 
-                LASTFM_API_SECRET, output, playlist_title,
+            playlist_title, json_path, count = convert_playlist(
+                get_youtube_client(YOUTUBE_API_KEY), playlist, output,
+                YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET,
                 progress_state,
-                progress_callback=lambda p: progress_state.update(progress=p),
-                no_music=no_music_mode.get()
+                progress_callback=lambda p, stages: progress_state.update(progress=p),
+                no_music=no_music_mode.get(),
+                resume=resume_mode.get()
             )
-            playlist_json = create_json(playlist_title, playlist_items)
-
-            json_path = os.path.join(output, sanitized_title + ".playlist")
-            with open(json_path, "w") as f:
-                json.dump(playlist_json, f, indent=4)
 
             progress_state["progress"] = 1.0
 
@@ -445,7 +2559,7 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
             progress_canvas.pack(pady=(0, 0))
         if not stats_canvas.winfo_ismapped():
             stats_canvas.pack(pady=(0, 10))
-        root.geometry("640x400")
+        root.geometry("640x425")
         status_label.config(text="Converting... Please wait...")
         playlist = playlist_id.get().strip()
         output = output_path.get().strip()
@@ -458,12 +2572,48 @@ def create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET):
     author_label = ttk.Label(main_frame, text="Made by Squirticulous", font=("Segoe UI", 9, "italic"), foreground="gray")
     author_label.place(relx=1.0, rely=1.0, anchor="se", x=-10, y=-5)
 
-    draw_songinfo_animated()
-    draw_rainbow_bar_animated()
-    draw_stats_animated()
+    # bench.py drives the animation through this to measure its cost.
+    root.progress_state = progress_state
+    animate()
     check_ready()
     return root
 
+def positive_float(value):
+    import argparse
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def add_fetch_arguments(parser):
+    # Shared by conversion runs and `cache prefetch`, which fetch the same way.
+    parser.add_argument("--playlist", action="append", help="YouTube playlist ID (repeat for batch mode)")
+    parser.add_argument("--playlists-file", help="File with one YouTube playlist ID per line, processed in batch mode")
+    parser.add_argument("--parallel-playlists", type=int, default=BATCH_PARALLEL_PLAYLISTS, help="Number of playlists processed at once in batch mode")
+    parser.add_argument("--no-music", action="store_true", help="Skip Last.fm and treat as generic video playlist")
+    parser.add_argument("--lastfm-workers", type=int, default=LASTFM_WORKERS, help="Number of concurrent Last.fm lookups")
+    parser.add_argument("--lastfm-rate", type=positive_float, default=LASTFM_RATE_LIMIT, help="Maximum Last.fm requests per second per API key")
+    parser.add_argument("--album-art-workers", type=int, default=ALBUM_ART_WORKERS, help="Number of concurrent album art downloads")
+    parser.add_argument("--quota-budget", type=int, default=YOUTUBE_QUOTA_BUDGET, help="Daily YouTube API quota units this tool may spend")
+    parser.add_argument("--wait-for-quota", action="store_true", help="When the quota budget runs out, wait for the daily reset instead of stopping")
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache-backend", choices=["sqlite", "files"], default=CACHE_BACKEND, help="Cache storage: single-file SQLite store or one JSON file per request")
+
+def fetch_playlist_ids(args):
+    playlist_ids = list(args.playlist or [])
+    if args.playlists_file:
+        playlist_ids.extend(read_playlist_ids(args.playlists_file))
+    return playlist_ids
+
+def fetch_options(args):
+    return {
+        "no_music": args.no_music,
+        "lastfm_workers": args.lastfm_workers,
+        "lastfm_rate": args.lastfm_rate,
+        "album_art_workers": args.album_art_workers
+    }
+
 def main():
     config = load_api_keys()
     YOUTUBE_API_KEY = config["YOUTUBE_API_KEY"]
@@ -471,41 +2621,177 @@ def main():
     LASTFM_API_SECRET = config["LASTFM_API_SECRET"]
 
     import argparse
-    parser = argparse.ArgumentParser(description="Generate a JSON playlist with Last.fm metadata from a YouTube playlist.")
-    parser.add_argument("--playlist", help="YouTube playlist ID")
+    parser = argparse.ArgumentParser(
+        description="Generate a JSON playlist with Last.fm metadata from a YouTube playlist.",
+        epilog="Cache maintenance (prefetch, stats, prune, verify) lives under 'final.py cache --help'."
+    )
+    add_fetch_arguments(parser)
+    add_cache_arguments(parser)
     parser.add_argument("--output", help="Output directory path")
-    parser.add_argument("--no-music", action="store_true", help="Skip Last.fm and treat as generic video playlist")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="protv", help="Output format: indented ProTV .playlist, minified JSON, gzip-compressed minified JSON, or one JSON entry per line")
+    parser.add_argument("--incremental", action="store_true", help="Re-sync against the playlist manifest in the output directory, refetching only added or changed videos")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted conversion from its checkpoint and partially written .playlist")
+    parser.add_argument("--migrate-cache", action="store_true", help="Import legacy cache/*.json files into the SQLite store and delete them")
+    parser.add_argument("--serve", action="store_true", help="Run as a long-lived HTTP service that converts submitted playlists into --output")
+    parser.add_argument("--host", default=SERVICE_HOST, help="Address the --serve HTTP service listens on")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Port the --serve HTTP service listens on")
+    parser.add_argument("--metrics", help="Write stage timings, cache, latency and retry metrics to this file at the end of the run ('-' for stdout)")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json", help="Format of the --metrics dump")
+    parser.add_argument("--profile", help="Write cProfile stats for the run (all threads) to this file")
     args = parser.parse_args()
+    profilers = start_profiling() if args.profile else None
+    try:
+        configure_cache(args.cache_backend)
 
-    if args.playlist and args.output:
-        playlist_id = args.playlist
-        output_dir = args.output
+        if args.migrate_cache:
+            cache = SqliteCache(os.path.join(CACHE_DIR, CACHE_DB_NAME), import_legacy=False)
+            imported = cache.import_directory(CACHE_DIR, remove=True)
+            print(f"Migrated {imported} cache entries into {cache.path}")
+            if not args.playlist and not args.playlists_file:
+                return
 
-        if not is_safe_path(output_dir):
-            raise ValueError("Unsafe output path detected.")
+        playlist_ids = fetch_playlist_ids(args)
 
-        os.makedirs(output_dir, exist_ok=True)
-        youtube = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
-        params = {
-            'part': 'snippet',
-            'id': playlist_id
-        }
-        playlist_response = youtube_cache_fetch(youtube, youtube.playlists().list, params)
-        playlist_title = playlist_response['items'][0]['snippet']['title']
-        sanitized_title = sanitize_filename(playlist_title)
-        progress_state = {"progress": 0.0}
-        playlist_items = get_playlist_items(
-            playlist_id, YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET,
-            output_dir, playlist_title, progress_state, no_music=args.no_music
+        if args.serve:
+            if not args.output:
+                parser.error("--serve needs --output")
+            if not is_safe_path(args.output):
+                raise ValueError("Unsafe output path detected.")
+            os.makedirs(args.output, exist_ok=True)
+            configure_quota(args.quota_budget, wait=args.wait_for_quota)
+            service = ConversionService(
+                get_youtube_client(YOUTUBE_API_KEY), args.output, YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET,
+                parallel_playlists=args.parallel_playlists, incremental=args.incremental, output_format=args.format,
+                **fetch_options(args)
+            )
+            run_server(service, args.host, args.port)
+        elif playlist_ids and args.output:
+            output_dir = args.output
+
+            if not is_safe_path(output_dir):
+                raise ValueError("Unsafe output path detected.")
+
+            os.makedirs(output_dir, exist_ok=True)
+            configure_quota(args.quota_budget, wait=args.wait_for_quota)
+            youtube = get_youtube_client(YOUTUBE_API_KEY)
+            report_quota_projection(youtube, playlist_ids)
+            options = {
+                **fetch_options(args),
+                "incremental": args.incremental,
+                "resume": args.resume,
+                "output_format": args.format
+            }
+            if len(playlist_ids) > 1:
+                results = run_batch(
+                    youtube, playlist_ids, output_dir, YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET,
+                    parallel_playlists=args.parallel_playlists, **options
+                )
+                if any(result["error"] for result in results):
+                    sys.exit(1)
+                return
+            progress_state = {"progress": 0.0}
+            try:
+                convert_playlist(
+                    youtube, playlist_ids[0], output_dir, YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET,
+                    progress_state, **options
+                )
+            except QuotaExhausted as e:
+                sys.exit(str(e))
+            print("Done! JSON and album art (if found) are saved in:", output_dir)
+            print(get_quota_tracker().summary())
+        else:
+            root = create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET)
+            root.mainloop()
+    finally:
+        if profilers:
+            stop_profiling(profilers, args.profile)
+        if args.metrics:
+            write_metrics(args.metrics, args.metrics_format)
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+def cache_main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="final.py cache", description="Inspect, prune, verify or pre-populate the cache directory.")
+    add_cache_arguments(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+    prefetch = commands.add_parser(
+        "prefetch", help="Fill the cache for playlists without writing any output",
+        description="Fill the cache for playlists without writing any output. Set --quota-budget below the daily total to leave room for daytime conversions."
+    )
+    add_fetch_arguments(prefetch)
+    commands.add_parser("stats", help="Show entries, size and hit ratio per namespace")
+    prune = commands.add_parser("prune", help="Remove expired entries, plus entries over an age or size limit")
+    prune.add_argument("--max-age", type=float, help="Remove entries older than this many days")
+    prune.add_argument("--max-size", type=float, help="Shrink the cache store to this many MB, least recently used first")
+    prune.add_argument("--max-art-size", type=float, help="Shrink the shared album art store to this many MB, oldest first")
+    prune.add_argument("--namespace", action="append", help=f"Only prune this namespace (repeatable; '{ALBUM_ART_STORE_NAME}' is the album art store)")
+    verify = commands.add_parser("verify", help="Check that every cache entry decodes")
+    verify.add_argument("--repair", action="store_true", help="Delete corrupt entries so they are fetched again")
+    args = parser.parse_args(argv)
+
+    configure_cache(args.cache_backend)
+    cache = get_cache()
+    if args.command == "prefetch":
+        playlist_ids = fetch_playlist_ids(args)
+        if not playlist_ids:
+            parser.error("prefetch needs --playlist or --playlists-file")
+        config = load_api_keys()
+        configure_quota(args.quota_budget, wait=args.wait_for_quota)
+        youtube = get_youtube_client(config["YOUTUBE_API_KEY"])
+        report_quota_projection(youtube, playlist_ids)
+        results = prefetch_playlists(
+            youtube, playlist_ids, config["YOUTUBE_API_KEY"], config["LASTFM_API_KEY"], config["LASTFM_API_SECRET"],
+            parallel_playlists=args.parallel_playlists, **fetch_options(args)
         )
-        playlist_json = create_json(playlist_title, playlist_items)
-        json_path = os.path.join(output_dir, sanitized_title + ".playlist")
-        with open(json_path, "w") as f:
-            json.dump(playlist_json, f, indent=4)
-        print("Done! JSON and album art (if found) are saved in:", output_dir)
-    else:
-        root = create_gui(YOUTUBE_API_KEY, LASTFM_API_KEY, LASTFM_API_SECRET)
-        root.mainloop()
+        print(get_quota_tracker().summary())
+        if any(result["error"] and not result["deferred"] for result in results):
+            sys.exit(1)
+    elif args.command == "stats":
+        rows = cache.stats() + [album_art_store_stats()]
+        print(f"{'namespace':<14} {'entries':>8} {'size':>10} {'hit ratio':>10}  oldest")
+        for row in rows:
+            lookups = (row["hits"] or 0) + (row["misses"] or 0)
+            ratio = f"{row['hits'] / lookups:.1%}" if lookups else "-"
+            oldest = datetime.datetime.fromtimestamp(row["oldest"]).strftime("%Y-%m-%d %H:%M") if row["oldest"] else "-"
+            print(f"{row['namespace']:<14} {row['entries']:>8} {format_bytes(row['bytes']):>10} {ratio:>10}  {oldest}")
+        print(f"{'total':<14} {sum(row['entries'] for row in rows):>8} {format_bytes(sum(row['bytes'] for row in rows)):>10}")
+    elif args.command == "prune":
+        max_age = args.max_age * 24 * 3600 if args.max_age is not None else None
+        namespaces = set(args.namespace or [])
+        store_namespaces = namespaces - {ALBUM_ART_STORE_NAME}
+        removed = 0
+        if not namespaces or store_namespaces:
+            removed = cache.prune(
+                max_age=max_age,
+                max_bytes=args.max_size * 1024 * 1024 if args.max_size is not None else None,
+                namespaces=store_namespaces
+            )
+        removed_art = 0
+        if not namespaces or ALBUM_ART_STORE_NAME in namespaces:
+            removed_art = prune_album_art_store(
+                max_age=max_age,
+                max_bytes=args.max_art_size * 1024 * 1024 if args.max_art_size is not None else None
+            )
+        print(f"Removed {removed} cache entries and {removed_art} album art files")
+    elif args.command == "verify":
+        bad = cache.verify(repair=args.repair) + verify_album_art_store(repair=args.repair)
+        for namespace, key, error in bad:
+            print(f"  BAD   {namespace}/{key}  {error}")
+        if not bad:
+            print("All cache entries are readable")
+        elif args.repair:
+            print(f"Removed {len(bad)} corrupt entries; they will be fetched again when next needed")
+        else:
+            print(f"{len(bad)} corrupt entries; run 'cache verify --repair' to remove them")
+            sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:2] == ["cache"]:
+        cache_main(sys.argv[2:])
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,14 @@
+import final
+
+
+def test_shared_output_dirs_groups_colliding_titles():
+    titles = {"PL1": "Favorites", "PL2": "favorites", "PL3": "Fav/orites", "PL4": "Fav:orites", "PL5": "Road trip"}
+    collisions = final.shared_output_dirs(titles)
+    assert collisions == {
+        "PL1": ["PL1", "PL2"], "PL2": ["PL1", "PL2"],
+        "PL3": ["PL3", "PL4"], "PL4": ["PL3", "PL4"]
+    }
+
+
+def test_shared_output_dirs_allows_distinct_titles():
+    assert final.shared_output_dirs({"PL1": "Favorites", "PL2": "Road trip"}) == {}
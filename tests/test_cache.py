@@ -0,0 +1,41 @@
+import os
+import time
+
+import final
+
+
+KEY = "0123456789abcdef0123456789abcdef"
+
+
+def test_file_cache_keeps_namespaces_apart(tmp_path):
+    cache = final.FileCache(str(tmp_path))
+    cache.set("lastfm_miss", KEY, {"error": 6})
+    assert cache.get("lastfm", KEY) is None
+    assert cache.get("lastfm_miss", KEY) == {"error": 6}
+    cache.set("tracks", "-dQw4w9WgXcQ", {"title": "Song"})
+    cache.set("lastfm", KEY, {"track": {}})
+    assert sorted(os.listdir(tmp_path)) == [f"{KEY}.json", f"lastfm_miss-{KEY}.json", "tracks--dQw4w9WgXcQ.json"]
+    assert {row["namespace"]: row["entries"] for row in cache.stats()} == {"lastfm": 1, "lastfm_miss": 1, "tracks": 1}
+
+
+def test_file_cache_expires_misses(tmp_path):
+    cache = final.FileCache(str(tmp_path))
+    cache.set("lastfm_miss", "abc", {"error": 6})
+    cache.set("lastfm", "def", {"track": {}})
+    old = time.time() - final.CACHE_TTLS["lastfm"] - 60
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (old, old))
+    assert cache.get("lastfm_miss", "abc") is None
+    # Legacy request entries never expired on this backend.
+    assert cache.get("lastfm", "def") == {"track": {}}
+
+
+def test_sqlite_imports_namespaced_files(tmp_path):
+    files = final.FileCache(str(tmp_path))
+    files.set("lastfm_miss", "abc", {"error": 6})
+    files.set("tracks", "vid", {"title": "Song"})
+    store = final.SqliteCache(str(tmp_path / "cache.sqlite"), import_legacy=False)
+    assert store.import_directory(str(tmp_path)) == 2
+    assert store.get("lastfm_miss", "abc") == {"error": 6}
+    assert store.get("tracks", "vid") == {"title": "Song"}
+    assert store.get("lastfm", "abc") is None
@@ -0,0 +1,50 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import final
+
+BODY = b"\x89PNG" + b"x" * 4096
+
+
+class TruncatingHandler(BaseHTTPRequestHandler):
+    # The first response promises the full image but closes halfway through.
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        TruncatingHandler.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY if TruncatingHandler.requests > 1 else BODY[:100])
+        self.close_connection = True
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(final, "retry_delay", lambda attempt, retry_after=None: 0)
+    TruncatingHandler.requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), TruncatingHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}/cover.png"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def retries():
+    return final.metrics.counters.get(("upstream_retries_total", (("upstream", "album_art"),)), 0)
+
+
+def test_download_restarts_a_truncated_body(tmp_path, server):
+    path = tmp_path / "cover.png"
+    before = retries()
+    final.download_file(server, str(path))
+    assert path.read_bytes() == BODY
+    assert TruncatingHandler.requests == 2
+    assert retries() == before + 1
+    assert [name.name for name in tmp_path.iterdir()] == ["cover.png"]
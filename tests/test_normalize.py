@@ -0,0 +1,33 @@
+import pytest
+
+import final
+
+
+@pytest.mark.parametrize("video_title, channel_title, topic, expected", [
+    ("Bohemian Rhapsody - Remastered 2011", "Queen", True, ("Queen", "Bohemian Rhapsody")),
+    ("Hey Jude - Remastered 2015", "The Beatles", False, ("The Beatles", "Hey Jude")),
+    ("Hey Jude (Remastered 2009)", "The Beatles", True, ("The Beatles", "Hey Jude")),
+    ("Wonderwall - Live at Knebworth", "Oasis", True, ("Oasis", "Wonderwall")),
+    ("Blinding Lights - Radio Edit", "The Weeknd", True, ("The Weeknd", "Blinding Lights")),
+    ("Live Forever", "Oasis", True, ("Oasis", "Live Forever")),
+    ("Rick Astley - Never Gonna Give You Up (Official Video) [4K]", "Rick Astley", False, ("Rick Astley", "Never Gonna Give You Up")),
+    ("Daft Punk - One More Time", "Some Uploader", False, ("Daft Punk", "One More Time")),
+    # A dash inside a Topic channel's title is part of the track name.
+    ("Part One - Intro", "Some Band", True, ("Some Band", "Part One - Intro")),
+    ("Some Band - Part One", "Some Band", True, ("Some Band", "Part One")),
+])
+def test_normalize_track(video_title, channel_title, topic, expected):
+    assert final.normalize_track(video_title, channel_title, topic) == expected
+
+
+def test_normalize_track_without_split_keeps_the_channel_artist():
+    assert final.normalize_track("Daft Punk - One More Time", "Some Uploader", split=False) == ("Some Uploader", "Daft Punk - One More Time")
+
+
+@pytest.mark.parametrize("key, candidate, expected", [
+    ("track4320", "track4321", False),
+    ("bohemianrhapsody", "bohemianrhapsodi", True),
+    ("part1", "part2", False),
+])
+def test_is_close_track(key, candidate, expected):
+    assert final.is_close_track(key, candidate) is expected
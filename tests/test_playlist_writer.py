@@ -0,0 +1,135 @@
+import gzip
+import json
+import time
+import types
+
+import pytest
+
+import final
+
+
+def make_entry(video_id):
+    return {
+        "mainUrl": f"https://www.youtube.com/watch?v={video_id}",
+        "alternateUrl": f"https://youtu.be/{video_id}",
+        "title": f"Song {video_id} - Ärtist",
+        "description": "",
+        "tags": "rock, pop",
+        "image": ""
+    }
+
+
+def write_playlist(path, entries, output_format="protv", resume=False):
+    with final.PlaylistWriter(str(path), "My Playlist", resume=resume, output_format=output_format) as writer:
+        for entry in entries:
+            writer.write(entry)
+    return writer
+
+
+def read_output(path, output_format):
+    data = path.read_bytes()
+    return gzip.decompress(data) if output_format == "gzip" else data
+
+
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_protv_output_matches_json_dump(tmp_path, count):
+    entries = [make_entry(f"v{i}") for i in range(count)]
+    path = tmp_path / "out.playlist"
+    write_playlist(path, entries)
+    expected = json.dumps(final.create_json("My Playlist", entries), indent=4)
+    assert path.read_text(encoding="utf-8") == expected
+    assert not (tmp_path / "out.playlist.part").exists()
+
+
+@pytest.mark.parametrize("output_format", sorted(final.OUTPUT_FORMATS))
+def test_resume_is_byte_identical(tmp_path, output_format):
+    entries = [make_entry(f"v{i}") for i in range(5)]
+    fresh = tmp_path / "fresh"
+    write_playlist(fresh, entries, output_format)
+
+    resumed = tmp_path / "resumed"
+    with pytest.raises(KeyboardInterrupt):
+        with final.PlaylistWriter(str(resumed), "My Playlist", output_format=output_format) as writer:
+            for entry in entries[:2]:
+                writer.write(entry)
+            raise KeyboardInterrupt
+    # A write torn halfway through an entry is dropped on resume.
+    with open(str(resumed) + ".part", "a", encoding="utf-8") as f:
+        f.write(',\n        {"mainUrl": "https://www.youtube.com/wat')
+
+    with final.PlaylistWriter(str(resumed), "My Playlist", resume=True, output_format=output_format) as writer:
+        assert writer.count == 2
+        assert writer.written == entries[:2]
+        for entry in entries[2:]:
+            writer.write(entry)
+    assert read_output(resumed, output_format) == read_output(fresh, output_format)
+
+
+class StubYouTube:
+    # Every video is answered by the track store, so no request is ever built.
+    def videos(self):
+        return types.SimpleNamespace(list=lambda **kwargs: None)
+
+
+@pytest.fixture
+def track_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(final, "CACHE_DIR", str(tmp_path / "cache"))
+    (tmp_path / "cache").mkdir()
+    final.configure_cache("sqlite")
+    cache = final.get_cache()
+    for video_id in "ABC":
+        cache.set("tracks", video_id, {"title": f"Song {video_id}", "channel": "Artist", "details_fetched": time.time()})
+    yield cache
+    final.configure_cache("sqlite")
+
+
+def resume_items(tmp_path, video_ids, written):
+    checkpoint = final.Checkpoint(str(tmp_path / "checkpoint.json"), "PL")
+    checkpoint.state = {
+        "playlist_id": "PL", "video_ids": video_ids, "item_etags": {}, "pages": {},
+        "next_page_token": None, "complete": True, "index": len(written)
+    }
+    return list(final.iter_playlist_items(
+        "PL", "key", None, None, str(tmp_path / "out"), "My Playlist", {"progress": 0.0},
+        no_music=True, youtube=StubYouTube(), written_entries=written, checkpoint=checkpoint
+    ))
+
+
+def test_resume_keeps_repeats_of_written_videos(tmp_path, track_store):
+    first = resume_items(tmp_path, ["A"], [])
+    remaining = resume_items(tmp_path, ["A", "B", "A", "C"], first)
+    assert [entry["mainUrl"][-1] for entry in remaining] == ["B", "A", "C"]
+
+
+def test_resume_rejects_a_changed_playlist(tmp_path, track_store):
+    written = resume_items(tmp_path, ["A", "B"], [])
+    with pytest.raises(ValueError):
+        resume_items(tmp_path, ["A", "C", "B"], written)
+
+
+def test_early_stop_cancels_queued_lookups(tmp_path, track_store, monkeypatch):
+    video_ids = [f"V{i}" for i in range(40)]
+    for video_id in video_ids:
+        track_store.set("tracks", video_id, {"title": f"Song {video_id}", "channel": "Artist", "details_fetched": time.time()})
+    looked_up = []
+
+    def slow_lookup(*args):
+        looked_up.append(args[0])
+        time.sleep(0.1)
+        return [], ""
+
+    monkeypatch.setattr(final, "lastfm_track_info", slow_lookup)
+    checkpoint = final.Checkpoint(str(tmp_path / "checkpoint.json"), "PL")
+    checkpoint.state = {
+        "playlist_id": "PL", "video_ids": video_ids, "item_etags": {}, "pages": {},
+        "next_page_token": None, "complete": True, "index": 0
+    }
+    items = final.iter_playlist_items(
+        "PL", "key", "lastfm-key", None, str(tmp_path / "out"), "My Playlist", {"progress": 0.0},
+        lastfm_workers=1, lastfm_rate=1000, youtube=StubYouTube(), checkpoint=checkpoint
+    )
+    next(items)
+    start = time.time()
+    items.close()
+    assert time.time() - start < 1
+    assert len(looked_up) < len(video_ids)